@@ -0,0 +1,43 @@
+"""无界面批处理入口
+
+从JSONL读取提示词, 按config.json中的agent配置并发调用模型,
+结果按完成顺序写入输出JSONL, 中断后重新运行会从检查点继续。
+
+用法:
+    python src/batch.py requests.jsonl -o results.jsonl --concurrency 16
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from lib.batch_runner import BatchRunner
+from lib.config_manager import ConfigManager
+from lib.logger_manager import LoggerManager
+
+
+def main():
+    parser = argparse.ArgumentParser(description="无界面批量运行JSONL中的提示词")
+    parser.add_argument("input", help="输入JSONL, 每行包含 prompt 和可选的 id、agent")
+    parser.add_argument("-o", "--output", help="输出JSONL(默认在输入文件名后加 .results)")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="同时进行的请求数")
+    parser.add_argument("--config", default="config.json", help="配置文件路径")
+    args = parser.parse_args()
+
+    logger = LoggerManager.get_logger()
+    output = args.output or f"{os.path.splitext(args.input)[0]}.results.jsonl"
+    logger.info(f"=== 批处理开始: {args.input} -> {output}, 并发{args.concurrency} ===")
+
+    runner = BatchRunner(ConfigManager(args.config), concurrency=args.concurrency)
+    stats = runner.run(args.input, output)
+
+    logger.info(
+        f"=== 批处理结束: 提交{stats['submitted']}条, 成功{stats['succeeded']}条, "
+        f"失败{stats['failed']}条, 跳过{stats['skipped']}条, 用时{stats['seconds']:.1f}秒 ==="
+    )
+    return 1 if stats['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,218 @@
+"""客户端热路径的端到端基准测试
+
+启动本地模拟服务器(lib/mock_server.py), 分别驱动:
+    1. ChatClient 的流式处理路径
+    2. ChatFrame.async_send_message -> MessagePanel 的界面路径
+报告首次显示时间、每秒渲染token数、界面更新延迟和每token的CPU时间,
+用于发现客户端热路径的性能回退。
+
+用法:
+    python src/benchmark.py --requests 5 --token-rate 200 --response-tokens 500
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SRC_DIR)
+
+
+def start_mock_server(args):
+    """在子进程中启动模拟服务器, 避免服务器的CPU消耗计入客户端"""
+    cmd = [
+        sys.executable, '-m', 'lib.mock_server',
+        '--port', '0',
+        '--token-rate', str(args.token_rate),
+        '--chunk-size', str(args.chunk_size),
+        '--first-token-delay', str(args.first_token_delay),
+        '--response-tokens', str(args.response_tokens),
+        '--error-rate', str(args.error_rate),
+    ]
+    proc = subprocess.Popen(cmd, cwd=SRC_DIR, stdout=subprocess.PIPE, text=True)
+    base_url = proc.stdout.readline().strip()
+    return proc, base_url
+
+
+def summarize(values):
+    """计算均值和分位数"""
+    if not values:
+        return {}
+    ordered = sorted(values)
+    return {
+        'mean': statistics.fmean(ordered),
+        'p50': ordered[len(ordered) // 2],
+        'p95': ordered[int(0.95 * (len(ordered) - 1))],
+        'max': ordered[-1],
+    }
+
+
+def bench_chat_client(base_url, args):
+    """测量ChatClient流式处理路径"""
+    from openai import OpenAI
+    from lib.chat_client import ChatClient
+
+    client = ChatClient(OpenAI(api_key='mock', base_url=base_url))
+    messages = [{"role": "user", "content": "benchmark"}]
+    first_paint, rates, cpu_per_token = [], [], []
+
+    for _ in range(args.requests):
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        first = []
+
+        def on_delta(delta):
+            if not first:
+                first.append(time.perf_counter() - start)
+
+        response = client.get_chat_completion(messages, 'mock-model')
+        full = client.process_stream_response(response, on_delta)
+        total = time.perf_counter() - start
+        if full.startswith("错误"):
+            continue
+
+        first_paint.append(first[0] * 1000)
+        rates.append(args.response_tokens / max(total - first[0], 1e-9))
+        cpu_per_token.append((time.process_time() - cpu_start) / args.response_tokens * 1e6)
+
+    return {
+        'time_to_first_paint_ms': summarize(first_paint),
+        'tokens_per_second': summarize(rates),
+        'cpu_per_token_us': summarize(cpu_per_token),
+        'completed': len(first_paint),
+    }
+
+
+def bench_gui(base_url, args):
+    """测量 ChatFrame.async_send_message -> MessagePanel 界面路径"""
+    import wx
+    from lib.chat_frame import ChatFrame
+    from lib.config_manager import ConfigManager
+    from lib.metrics import MetricsRegistry
+
+    config = {
+        'openai': {'api_key': 'mock', 'base_url': base_url, 'max_concurrency': 8},
+        'hotkeys': {'show_window': 'ctrl+alt+shift+f12'},
+        'agents': {'default': {'nickname': 'default', 'role_system': 'benchmark', 'model': 'mock-model'}},
+        # 基准测试的对话不写入用户的对话存储
+        'history': {'enabled': False},
+    }
+    config_dir = tempfile.mkdtemp(prefix='chat_bench_')
+    config_path = os.path.join(config_dir, 'config.json')
+    with open(config_path, 'w', encoding='utf-8') as f:
+        json.dump(config, f)
+
+    # 托盘图标从工作目录加载icon.png
+    os.chdir(os.path.dirname(SRC_DIR))
+    app = wx.App(False)
+    frame = ChatFrame(ConfigManager(config_path))
+    frame.Show()
+    panel = frame.history_panel
+    token_len = len('token ')
+
+    state = {'index': 0, 'start': 0.0, 'first': None, 'last': None, 'chars': 0}
+    first_paint, rates = [], []
+    total_tokens = [0]
+
+    # 记录界面实际渲染的时间点
+    original_append = panel.append_message_text
+
+    def timed_append(message_text, delta):
+        original_append(message_text, delta)
+        now = time.perf_counter()
+        if state['first'] is None:
+            state['first'] = now
+        state['last'] = now
+        state['chars'] += len(delta)
+    panel.append_message_text = timed_append
+
+    def run_next():
+        if state['index'] >= args.requests:
+            frame.force_exit(None)
+            return
+        state.update(index=state['index'] + 1, start=time.perf_counter(),
+                     first=None, last=None, chars=0)
+        frame.OnNew(None)
+        future = frame.async_send_message("benchmark")
+        future.add_done_callback(lambda f: wx.CallAfter(finish_one))
+
+    def finish_one():
+        # 等待渲染节拍把最后的增量应用到界面
+        if frame.render_loop.active:
+            wx.CallLater(5, finish_one)
+            return
+        if state['first'] is not None:
+            tokens = state['chars'] / token_len
+            total_tokens[0] += tokens
+            first_paint.append((state['first'] - state['start']) * 1000)
+            rates.append(tokens / max(state['last'] - state['first'], 1e-9))
+        run_next()
+
+    cpu_start = time.process_time()
+    wx.CallAfter(run_next)
+    app.MainLoop()
+    cpu = time.process_time() - cpu_start
+
+    # 界面更新延迟(增量到达到界面执行)由请求指标记录
+    update_lag = {}
+    for series in MetricsRegistry.get_registry().snapshot():
+        hist = series['histograms']['ui_apply']
+        if series['agent'] == 'default' and hist['count']:
+            update_lag = {k: hist[k] * 1000 for k in ('mean', 'p50', 'p95', 'max')}
+
+    return {
+        'time_to_first_paint_ms': summarize(first_paint),
+        'tokens_per_second_rendered': summarize(rates),
+        'ui_update_lag_ms': update_lag,
+        'cpu_per_token_us': cpu / max(total_tokens[0], 1) * 1e6,
+        'completed': len(first_paint),
+    }
+
+
+def print_report(name, result):
+    print(f"== {name} ==")
+    for key, value in result.items():
+        if isinstance(value, dict):
+            parts = ", ".join(f"{k}={v:.2f}" for k, v in value.items())
+            print(f"  {key}: {parts}")
+        elif isinstance(value, float):
+            print(f"  {key}: {value:.2f}")
+        else:
+            print(f"  {key}: {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="客户端热路径基准测试")
+    parser.add_argument("--requests", type=int, default=5, help="每个路径的请求次数")
+    parser.add_argument("--token-rate", type=float, default=200.0, help="模拟服务器每秒token数")
+    parser.add_argument("--chunk-size", type=int, default=1, help="每个SSE块的token数")
+    parser.add_argument("--first-token-delay", type=float, default=0.05, help="首个token前的等待秒数")
+    parser.add_argument("--response-tokens", type=int, default=500, help="每个回答的token数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入错误的概率(0~1)")
+    parser.add_argument("--skip-gui", action="store_true", help="只测量ChatClient路径")
+    parser.add_argument("--json", help="把结果写入指定的JSON文件")
+    args = parser.parse_args()
+
+    proc, base_url = start_mock_server(args)
+    results = {}
+    try:
+        results['chat_client'] = bench_chat_client(base_url, args)
+        print_report("ChatClient", results['chat_client'])
+        if not args.skip_gui:
+            results['gui'] = bench_gui(base_url, args)
+            print_report("ChatFrame -> MessagePanel", results['gui'])
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
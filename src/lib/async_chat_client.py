@@ -0,0 +1,435 @@
+import asyncio
+import email.utils
+import random
+import threading
+import time
+from collections import deque
+from .logger_manager import LoggerManager
+from .response_cache import ResponseCache
+from .metrics import RequestMetrics, current_request
+from .context_window import estimate_tokens
+
+class _Flight:
+    """同一缓存键上正在进行的上游请求, 供多个订阅者共享"""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.condition = asyncio.Condition()
+
+    async def append(self, content):
+        async with self.condition:
+            self.chunks.append(content)
+            self.condition.notify_all()
+
+    async def finish(self, error=None):
+        async with self.condition:
+            self.done = True
+            self.error = error
+            self.condition.notify_all()
+
+    async def subscribe(self):
+        """从头回放已收到的增量, 然后跟随后续增量"""
+        index = 0
+        while True:
+            async with self.condition:
+                await self.condition.wait_for(lambda: len(self.chunks) > index or self.done)
+                new_chunks = self.chunks[index:]
+                index = len(self.chunks)
+                finished = self.done
+            for content in new_chunks:
+                yield content
+            if finished:
+                if self.error is not None:
+                    raise self.error
+                return
+
+class AsyncChatClient:
+    """基于AsyncOpenAI的聊天客户端
+
+    在独立的事件循环线程中运行, 多个流式请求可以同时进行,
+    并发数量由 max_concurrency 限制。
+    启用缓存的请求会先查询 ResponseCache, 相同的并发请求只发起一次上游调用。
+
+    一个请求可以指定多个endpoint客户端: 收到首个token之前的瞬时错误会以
+    指数退避重试, 并依次切换到下一个endpoint。开启hedge时, 如果首个token
+    在该endpoint的p95首字延迟内仍未到达, 会向下一个endpoint发出第二个请求,
+    先返回首个token的一方胜出, 另一方被取消。
+
+    配置了 RateLimiter 时, 每个请求发出前按 (base_url, model) 排队等待额度,
+    收到429时按 Retry-After 暂停该endpoint, 请求继续排队而不是直接失败。
+    """
+
+    # 可以重试的HTTP状态码
+    TRANSIENT_STATUS = (408, 409, 429, 500, 502, 503, 504)
+
+    def __init__(self, openai_client, max_concurrency=8, cache=None, retry=None, rate_limiter=None,
+                 update_interval=0.1):
+        self.client = openai_client
+        self.max_concurrency = max_concurrency
+        # 回调推送间隔; 界面侧自行按帧合并时可以设为0, 每个增量立即推送
+        self.update_interval = update_interval
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.logger = LoggerManager.get_logger()
+
+        # 重试与对冲设置
+        self._apply_retry(retry)
+
+        # 各endpoint最近的首字延迟样本, 用于计算p95
+        self.ttft_samples = {}
+
+        # 正在进行中的可缓存请求: 缓存键 -> _Flight
+        self._inflight = {}
+
+        # 创建专用的事件循环线程
+        self.loop = asyncio.new_event_loop()
+        self.semaphore = None
+        self._ready = threading.Event()
+        self.thread = threading.Thread(target=self._run_loop, name="AsyncChatClient", daemon=True)
+        self.thread.start()
+        self._ready.wait()
+
+    def _run_loop(self):
+        """事件循环线程入口"""
+        asyncio.set_event_loop(self.loop)
+        # 信号量必须在所属的事件循环中创建
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._ready.set()
+        self.loop.run_forever()
+
+    def _apply_retry(self, retry):
+        retry = retry or {}
+        self.max_retries = retry.get('max_retries', 3)
+        self.backoff_base = retry.get('backoff_base', 0.5)
+        self.backoff_max = retry.get('backoff_max', 8.0)
+        self.hedge = retry.get('hedge', False)
+        self.hedge_delay = retry.get('hedge_delay', 2.0)  # 样本不足时的对冲等待时间
+        self.max_rate_limit_retries = retry.get('max_rate_limit_retries', 10)
+
+    def reconfigure(self, max_concurrency=None, retry=None, rate_limits=None):
+        """配置变化时更新并发数、重试设置和限流规则, 只影响之后开始的请求
+
+        在事件循环线程中执行; 已经在排队或进行中的请求按原来的设置完成。
+        """
+        def apply():
+            if retry is not None:
+                self._apply_retry(retry)
+            if max_concurrency is not None and max_concurrency != self.max_concurrency:
+                self.max_concurrency = max_concurrency
+                self.semaphore = asyncio.Semaphore(max_concurrency)
+            if rate_limits is not None and self.rate_limiter is not None:
+                self.rate_limiter.update_rules(rate_limits)
+        self.loop.call_soon_threadsafe(apply)
+
+    def set_client(self, openai_client):
+        """替换底层的AsyncOpenAI客户端(配置变化时调用)"""
+        self.client = openai_client
+
+    async def stream_chat_completion(self, messages, model, use_cache=False, clients=None, hedge=None):
+        """以异步生成器的形式逐个产出增量文本"""
+        clients = clients or [self.client]
+        if not use_cache or self.cache is None:
+            async for content in self._stream_upstream(messages, model, clients, hedge):
+                yield content
+            return
+
+        key = ResponseCache.make_key(str(clients[0].base_url), model, messages)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.logger.debug(f"响应缓存命中: {key}")
+            metrics = current_request.get()
+            if metrics is not None:
+                metrics.cache_hit = True
+            async for content in self._replay(cached):
+                yield content
+            return
+
+        # 单飞合并: 相同请求共享同一个上游流
+        flight = self._inflight.get(key)
+        if flight is None:
+            flight = _Flight()
+            self._inflight[key] = flight
+            self.loop.create_task(self._lead_flight(key, flight, messages, model, clients, hedge))
+        else:
+            self.logger.debug(f"合并相同请求: {key}")
+        async for content in flight.subscribe():
+            yield content
+
+    async def _lead_flight(self, key, flight, messages, model, clients, hedge):
+        """执行上游请求并把增量分发给所有订阅者, 成功后写入缓存"""
+        try:
+            async for content in self._stream_upstream(messages, model, clients, hedge):
+                await flight.append(content)
+        except Exception as e:
+            await flight.finish(e)
+        else:
+            await flight.finish()
+            # 磁盘写入放到线程池, 不阻塞事件循环
+            await self.loop.run_in_executor(None, self.cache.put, key, "".join(flight.chunks))
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _replay(self, text, chunk_size=32):
+        """把缓存文本切块产出, 保持与真实流式响应相同的UI路径"""
+        for i in range(0, len(text), chunk_size):
+            yield text[i:i + chunk_size]
+            await asyncio.sleep(0)
+
+    async def _stream_upstream(self, messages, model, clients, hedge=None):
+        """向上游发起流式请求, 首个token之前的失败会重试或切换endpoint
+
+        并发名额只在连接和读取期间占用, 限流排队和重试退避时不占用,
+        排队的请求不会挡住其他endpoint的请求。
+        """
+        stream, chunks, first, client, slot = await self._connect(messages, model, clients, hedge)
+        produced = []
+        try:
+            if first is not None:
+                produced.append(first)
+                yield first
+            async for chunk in chunks:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    produced.append(chunk.choices[0].delta.content)
+                    # 每个增量一条, 由日志的 stream_chunk 规则采样限速
+                    self.logger.debug(f"收到增量: 第{len(produced)}块, {len(produced[-1])}字符",
+                                      extra={'event': 'stream_chunk'})
+                    yield chunk.choices[0].delta.content
+        finally:
+            await self._close_stream(stream, slot)
+            if self.rate_limiter is not None:
+                # 补扣生成部分的token额度
+                self.rate_limiter.charge(str(client.base_url), model, estimate_tokens("".join(produced)))
+
+    async def _connect(self, messages, model, clients, hedge=None):
+        """带退避重试和故障转移地建立连接, 返回 (stream, 迭代器, 首个增量, 客户端, 并发名额)"""
+        hedge = self.hedge if hedge is None else hedge
+        index = 0          # 当前使用的endpoint
+        attempt = 0        # 普通重试次数
+        rate_limited = 0   # 429重试次数, 单独计数
+        while True:
+            client = clients[index % len(clients)]
+            try:
+                if hedge and len(clients) > 1:
+                    backup = clients[(index + 1) % len(clients)]
+                    return await self._open_hedged(client, backup, messages, model)
+                return await self._open_stream(client, messages, model)
+            except Exception as e:
+                retry_after = self._retry_after(e)
+                if (retry_after is not None and self.rate_limiter is not None
+                        and rate_limited < self.max_rate_limit_retries):
+                    # 交给限流器: 该endpoint暂停放行, 请求换到下一个endpoint重新排队
+                    self.rate_limiter.on_rate_limited(str(client.base_url), model, retry_after)
+                    self.logger.warning(f"{client.base_url} 限流, {retry_after:.2f}秒后恢复放行")
+                    rate_limited += 1
+                    index += 1
+                    continue
+                if attempt >= self.max_retries or not self._is_transient(e):
+                    raise
+                delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+                delay *= 0.5 + random.random() / 2
+                if retry_after is not None:
+                    delay = max(delay, retry_after)
+                self.logger.warning(
+                    f"请求 {client.base_url} 失败({str(e)}), {delay:.2f}秒后第{attempt + 1}次重试"
+                )
+                await asyncio.sleep(delay)
+                attempt += 1
+                index += 1
+
+    @staticmethod
+    def _retry_after(error):
+        """从429/503响应中解析服务端要求的等待秒数, 其他错误返回None"""
+        # openai在创建客户端时已导入, 这里只是取出模块, 启动时不必提前导入
+        import openai
+        if not isinstance(error, openai.APIStatusError) or error.status_code not in (429, 503):
+            return None
+        headers = error.response.headers
+        if headers.get('retry-after-ms'):
+            try:
+                return float(headers['retry-after-ms']) / 1000
+            except ValueError:
+                pass
+        value = headers.get('retry-after')
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                try:
+                    return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+                except (TypeError, ValueError):
+                    pass
+        # 429没有给出等待时间时默认等待1秒
+        return 1.0 if error.status_code == 429 else None
+
+    def _is_transient(self, error):
+        """判断错误是否值得重试"""
+        import openai
+        if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+            return True
+        if isinstance(error, openai.APIStatusError):
+            return error.status_code in self.TRANSIENT_STATUS
+        return False
+
+    async def _open_stream(self, client, messages, model, admitted=None):
+        """先取得限流令牌再占用并发名额, 打开流式请求并读取到第一个内容增量
+
+        成功时返回的并发名额由调用方在流结束时通过 _close_stream 释放。
+        admitted 在取得令牌和名额后设置, 对冲的首字计时从这时开始。
+        """
+        if self.rate_limiter is not None:
+            prompt_tokens = sum(estimate_tokens(str(m.get('content') or '')) for m in messages)
+            await self.rate_limiter.acquire(str(client.base_url), model, prompt_tokens)
+        # 记下获得名额的信号量, 并发数在期间被修改时仍释放到同一个信号量
+        slot = self.semaphore
+        await slot.acquire()
+        stream = None
+        try:
+            if admitted is not None:
+                admitted.set()
+            start = time.monotonic()
+            stream = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                stream=True
+            )
+            metrics = current_request.get()
+            if metrics is not None:
+                metrics.mark_first_byte()
+            chunks = stream.__aiter__()
+            async for chunk in chunks:
+                # 第一个增量通常是内容为空字符串的role块, 只有非空内容才算首字
+                if chunk.choices and chunk.choices[0].delta.content:
+                    self._record_ttft(client, time.monotonic() - start)
+                    return stream, chunks, chunk.choices[0].delta.content, client, slot
+        except BaseException:
+            # 包括被对冲取消的情况, 释放连接和并发名额
+            await self._close_stream(stream, slot)
+            raise
+        return stream, chunks, None, client, slot
+
+    @staticmethod
+    async def _close_stream(stream, slot):
+        """关闭流并归还并发名额"""
+        try:
+            if stream is not None:
+                await stream.close()
+        finally:
+            slot.release()
+
+    async def _open_hedged(self, primary, backup, messages, model):
+        """对冲请求: 主endpoint超过p95首字延迟时向备用endpoint再发一次
+
+        首字计时从主请求取得限流令牌和并发名额之后开始, 排队时间不计入。
+        """
+        admitted = asyncio.Event()
+        first = asyncio.ensure_future(self._open_stream(primary, messages, model, admitted))
+        waiter = asyncio.ensure_future(admitted.wait())
+        try:
+            await asyncio.wait({first, waiter}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()
+        done, _ = await asyncio.wait({first}, timeout=self._hedge_deadline(primary))
+        if done:
+            return first.result()
+
+        self.logger.info(f"{primary.base_url} 首字超时, 对冲请求 {backup.base_url}")
+        second = asyncio.ensure_future(self._open_stream(backup, messages, model))
+        pending = {first, second}
+        winner = None
+        error = None
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                elif winner is None:
+                    winner = task.result()
+                else:
+                    # 两个请求同时完成, 关闭多余的流
+                    stream, _, _, _, slot = task.result()
+                    await self._close_stream(stream, slot)
+
+        # 取消落后的请求
+        for task in pending:
+            task.cancel()
+        if winner is None:
+            raise error
+        return winner
+
+    def _record_ttft(self, client, seconds):
+        samples = self.ttft_samples.setdefault(str(client.base_url), deque(maxlen=100))
+        samples.append(seconds)
+
+    def _hedge_deadline(self, client):
+        """该endpoint首字延迟的p95, 样本不足时使用默认值"""
+        samples = self.ttft_samples.get(str(client.base_url))
+        if not samples or len(samples) < 20:
+            return self.hedge_delay
+        ordered = sorted(samples)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    async def process_stream_response(self, messages, model, message_callback, use_cache=False,
+                                      clients=None, hedge=None, metrics=None):
+        """处理流式响应, 每隔update_interval通过回调推送一次新增的增量文本
+
+        metrics.flush_arrival 在每次回调前更新为本批增量中最早片段的到达时间,
+        回调方可以据此测量界面应用延迟。
+        """
+        if metrics is None:
+            metrics = RequestMetrics('-', model)
+        token = current_request.set(metrics)
+        try:
+            parts = []      # 完整回复的所有片段, 结束时一次性拼接
+            pending = []    # 尚未推送给UI的片段
+            last_update = time.time()
+            update_interval = self.update_interval
+
+            async for content in self.stream_chat_completion(messages, model, use_cache, clients, hedge):
+                # 空增量不计入首字时间、间隔和生成速度
+                if not content:
+                    continue
+                arrival = metrics.mark_chunk()
+                if not pending:
+                    metrics.flush_arrival = arrival
+                parts.append(content)
+                pending.append(content)
+
+                # 检查是否需要更新UI
+                current_time = time.time()
+                if current_time - last_update >= update_interval:
+                    message_callback("".join(pending))
+                    pending = []
+                    last_update = current_time
+
+            # 确保最后的内容被显示
+            if pending:
+                message_callback("".join(pending))
+
+            full_response = "".join(parts)
+            metrics.finish(full_response)
+            return full_response
+        except Exception as e:
+            self.logger.error(f"流式请求失败: {str(e)}")
+            metrics.finish(error=e)
+            return f"错误: {str(e)}"
+        finally:
+            current_request.reset(token)
+
+    def submit(self, messages, model, message_callback, use_cache=False, clients=None, hedge=None,
+               metrics=None):
+        """从任意线程提交请求, 返回 concurrent.futures.Future"""
+        coro = self.process_stream_response(messages, model, message_callback, use_cache, clients, hedge,
+                                            metrics)
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro):
+        """在事件循环线程中执行任意协程, 返回 concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def close(self):
+        """停止事件循环线程"""
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout=1)
@@ -0,0 +1,159 @@
+import json
+import os
+import threading
+import time
+from .async_chat_client import AsyncChatClient
+from .logger_manager import LoggerManager
+from .metrics import RequestMetrics
+from .rate_limiter import RateLimiter
+from .response_cache import ResponseCache
+
+class BatchRunner:
+    """无界面批量运行JSONL中的提示词
+
+    输入每行格式: {"id": "可选", "agent": "昵称, 可选", "prompt": "问题"}
+    也可以用 "messages" 直接给出完整的消息列表。
+    结果按完成顺序追加到输出JSONL; 输出文件同时作为检查点,
+    重新运行时跳过已经成功完成的id。
+    """
+
+    def __init__(self, config_manager, concurrency=8):
+        self.logger = LoggerManager.get_logger()
+        self.config_manager = config_manager
+        self.config = config_manager.get_config()
+        self.concurrency = concurrency
+        cache_config = self.config.get('cache', {})
+        self.chat_client = AsyncChatClient(
+            config_manager.get_async_client(),
+            max_concurrency=concurrency,
+            cache=ResponseCache(
+                max_memory_entries=cache_config.get('max_memory_entries', 128),
+                max_disk_bytes=cache_config.get('max_disk_mb', 50) * 1024 * 1024
+            ),
+            retry=self.config['openai'].get('retry', {}),
+            rate_limiter=RateLimiter(self.config.get('rate_limits', []))
+        )
+        config_manager.set_async_runner(self.chat_client.run)
+        self.write_lock = threading.Lock()
+
+    @staticmethod
+    def load_done_ids(output_path):
+        """读取已完成(无错误)的id, 用于断点续跑"""
+        done = set()
+        if not os.path.exists(output_path):
+            return done
+        with open(output_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 上次中断时可能留下写了一半的行
+                    continue
+                if record.get('error') is None:
+                    done.add(str(record.get('id')))
+        return done
+
+    def iter_prompts(self, input_path, done):
+        """逐行读取输入, 跳过空行和已完成的id"""
+        with open(input_path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    self.logger.warning(f"第{line_number}行不是有效的JSON, 已跳过: {str(e)}")
+                    continue
+                prompt_id = str(record.get('id', line_number))
+                if prompt_id in done:
+                    continue
+                yield prompt_id, record
+
+    def build_request(self, record):
+        """解析agent并构建消息列表"""
+        nickname = record.get('agent', 'default')
+        if nickname not in self.config['agents']:
+            self.logger.warning(f"未找到agent {nickname}, 使用default")
+            nickname = 'default'
+        agent = self.config['agents'][nickname]
+        messages = record.get('messages') or [
+            {"role": "system", "content": agent['role_system']},
+            {"role": "user", "content": record['prompt']}
+        ]
+        return nickname, agent, messages
+
+    def run(self, input_path, output_path):
+        """运行批处理, 返回统计信息"""
+        done = self.load_done_ids(output_path)
+        if done:
+            self.logger.info(f"检查点中已有{len(done)}条完成的结果, 跳过")
+
+        stats = {'submitted': 0, 'succeeded': 0, 'failed': 0, 'skipped': len(done)}
+        # 限制同时排队的请求数, 输入文件再大也不会一次性全部读入
+        slots = threading.BoundedSemaphore(self.concurrency * 2)
+        all_done = threading.Event()
+        pending = [1]  # 提交循环本身占一个计数, 结束时释放
+        start = time.time()
+
+        with open(output_path, 'a', encoding='utf-8') as output:
+
+            def release():
+                with self.write_lock:
+                    pending[0] -= 1
+                    if pending[0] == 0:
+                        all_done.set()
+
+            def on_complete(prompt_id, nickname, model, metrics, future):
+                try:
+                    response = future.result()
+                    # 失败由metrics记录, 不按回答的文字判断(正常回答也可能以"错误"开头)
+                    error = str(metrics.error) if metrics.error is not None else None
+                except Exception as e:
+                    response, error = None, str(e)
+                record = {
+                    'id': prompt_id,
+                    'agent': nickname,
+                    'model': model,
+                    'response': None if error else response,
+                    'error': error,
+                    'latency': metrics.end - metrics.start if metrics.end else None,
+                }
+                with self.write_lock:
+                    output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    output.flush()
+                    stats['failed' if error else 'succeeded'] += 1
+                    finished = stats['succeeded'] + stats['failed']
+                if finished % 100 == 0:
+                    self.logger.info(f"批处理进度: 已完成{finished}条, 用时{time.time() - start:.1f}秒")
+                slots.release()
+                release()
+
+            for prompt_id, record in self.iter_prompts(input_path, done):
+                try:
+                    nickname, agent, messages = self.build_request(record)
+                except KeyError:
+                    self.logger.warning(f"{prompt_id} 缺少prompt字段, 已跳过")
+                    continue
+                slots.acquire()
+                with self.write_lock:
+                    pending[0] += 1
+                stats['submitted'] += 1
+                metrics = RequestMetrics(nickname, agent['model'])
+                future = self.chat_client.submit(
+                    messages, agent['model'], lambda delta: None,
+                    use_cache=agent.get('cache', False),
+                    clients=self.config_manager.get_async_clients(agent),
+                    hedge=agent.get('hedge'),
+                    metrics=metrics
+                )
+                future.add_done_callback(
+                    lambda f, p=prompt_id, n=nickname, m=agent['model'], r=metrics: on_complete(p, n, m, r, f)
+                )
+
+            release()
+            all_done.wait()
+
+        self.chat_client.close()
+        stats['seconds'] = time.time() - start
+        return stats
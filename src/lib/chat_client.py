@@ -16,31 +16,30 @@ class ChatClient:
             return f"错误: {str(e)}"
             
     def process_stream_response(self, response, message_callback):
-        """处理流式响应"""
+        """处理流式响应, 回调只接收新增的增量文本"""
         try:
-            full_response = ""
-            buffer = ""
+            parts = []      # 完整回复的所有片段, 结束时一次性拼接
+            pending = []    # 尚未推送给UI的片段
             last_update = time.time()
             update_interval = 0.1  # 100ms更新一次UI
             
             for chunk in response:
                 if chunk.choices[0].delta.content is not None:
                     content = chunk.choices[0].delta.content
-                    full_response += content
-                    buffer += content
+                    parts.append(content)
+                    pending.append(content)
                     
                     # 检查是否需要更新UI
                     current_time = time.time()
                     if current_time - last_update >= update_interval:
-                        if buffer:
-                            message_callback(full_response)
-                            buffer = ""
-                            last_update = current_time
+                        message_callback("".join(pending))
+                        pending = []
+                        last_update = current_time
                             
             # 确保最后的内容被显示
-            if buffer:
-                message_callback(full_response)
+            if pending:
+                message_callback("".join(pending))
                 
-            return full_response
+            return "".join(parts)
         except Exception as e:
             return f"错误: {str(e)}"
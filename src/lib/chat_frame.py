@@ -1,31 +1,59 @@
 import wx
+import copy
 import json
 import os
 import threading
-from concurrent.futures import ThreadPoolExecutor
+import time
+from concurrent.futures import Future
 from .config_manager import ConfigManager
 from .hotkey_manager import HotkeyManager
-from .chat_client import ChatClient
-from .message_panel import MessagePanel
-from .ui import ChatTrayIcon, ConfigDialog, AgentConfigDialog
+from .async_chat_client import AsyncChatClient
+from .response_cache import ResponseCache
+from .metrics import RequestMetrics
+from .rate_limiter import RateLimiter
+from .render_loop import RenderLoop
+from .chat_session import ChatSession
+from .conversation_store import ConversationStore
+from .history_compactor import HistoryCompactor
+from .startup_timer import StartupTimer, DEFAULT_BUDGET_MS
 
 class ChatFrame(wx.Frame):
-    def __init__(self):
+    """主窗口
+
+    构造时只创建显示窗口所需的部分; 托盘图标、全局热键和恢复上次对话在窗口显示后
+    由 finish_startup 完成, openai SDK 的导入和客户端创建在后台线程中进行,
+    设置类对话框在打开时才导入。
+    """
+
+    def __init__(self, config_manager=None, startup_timer=None, instance_server=None, initial_command=None):
         super().__init__(None, title="Quick Chat Launcher", size=(400, 600),
                         style=wx.DEFAULT_FRAME_STYLE)
+        self.startup_timer = startup_timer or StartupTimer()
+        # 单实例服务: 之后启动的进程把命令行参数转发到这里
+        self.instance_server = instance_server
+        self.initial_command = initial_command
         
-        # 初始化配置管理器
-        self.config_manager = ConfigManager()
+        # 初始化配置管理器(基准测试等场景可以传入指定配置)
+        self.config_manager = config_manager or ConfigManager()
         self.config = self.config_manager.get_config()
+        self.startup_timer.mark("加载配置")
+        
+        # 对话存储(history.enabled为false时不保存)
+        history_config = self.config.get('history', {})
+        self.conversation_store = None
+        if history_config.get('enabled', True):
+            self.conversation_store = ConversationStore(page_size=history_config.get('page_size', 50))
+        self.startup_timer.mark("打开对话存储")
+        
+        # 对话标签页, 每个会话有独立的聊天历史、agent和进行中的请求
+        self.sessions = []
+        self.session_count = 0
         
         # 初始化UI
         self.InitUI()
         
-        # 创建线程池
-        self.thread_pool = ThreadPoolExecutor(max_workers=1)
-        
-        # 创建系统托盘图标
-        self.tray_icon = ChatTrayIcon(self)
+        # 系统托盘图标在窗口显示后创建
+        self.tray_icon = None
         
         # 绑定关闭事件
         self.Bind(wx.EVT_CLOSE, self.OnClose)
@@ -37,18 +65,47 @@ class ChatFrame(wx.Frame):
         self.Layout()
         wx.CallAfter(self.UpdateLayout)
         
-        # 初始化热键管理器
+        # 初始化热键管理器(窗口显示后再注册)
         self.hotkey_manager = HotkeyManager(self.config, self.safe_toggle_window)
-        self.hotkey_manager.setup_global_hotkey()
-        
-        # 初始化聊天客户端
-        self.chat_client = ChatClient(self.config_manager.get_client())
-        
-        # 初始化聊天历史
-        self.current_agent = "default"
-        self.chat_history = [
-            ("system", self.config['agents']['default']['role_system'])
-        ]
+        self.startup_timer.mark("创建界面")
+        
+        # 初始化响应缓存(各agent通过 cache: true 单独开启)
+        cache_config = self.config.get('cache', {})
+        self.response_cache = ResponseCache(
+            max_memory_entries=cache_config.get('max_memory_entries', 128),
+            max_disk_bytes=cache_config.get('max_disk_mb', 50) * 1024 * 1024
+        )
+        
+        # 初始化聊天客户端(独立事件循环线程, 支持多个请求并发)
+        # 默认的AsyncOpenAI客户端在后台创建完成后再设置, 发送时按agent取客户端
+        self.chat_client = AsyncChatClient(
+            None,
+            max_concurrency=self.config['openai'].get('max_concurrency', 8),
+            cache=self.response_cache,
+            retry=self.config['openai'].get('retry', {}),
+            rate_limiter=RateLimiter(self.config.get('rate_limits', [])),
+            update_interval=0  # 由渲染节拍按帧合并, 工作线程不再节流
+        )
+        
+        # 回收空闲的provider客户端时, 连接池在聊天客户端的事件循环中关闭
+        self.config_manager.set_async_runner(self.chat_client.run)
+        
+        # 配置变化(设置对话框或外部编辑配置文件)时只更新受影响的部分
+        self.config_manager.add_listener(lambda changed: wx.CallAfter(self.on_config_changed, changed))
+        self.config_manager.start_watching()
+        
+        # 后台滚动摘要(各agent通过 compaction 单独开启)
+        self.compactor = HistoryCompactor(self.chat_client, self.config_manager, wx.CallAfter)
+        
+        # GUI侧渲染节拍: 工作线程只投递到邮箱, 每帧统一应用
+        self.render_loop = RenderLoop(self, self.apply_stream_delta)
+        
+        # 定时在状态栏显示限流排队的请求数
+        self.queue_depth = 0
+        self.queue_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.OnQueueTimer, self.queue_timer)
+        self.queue_timer.Start(500)
+        self.startup_timer.mark("创建聊天客户端")
 
         # 设置初始窗口位置为屏幕中央
         self.Center()
@@ -56,7 +113,203 @@ class ChatFrame(wx.Frame):
         # 设置窗口置顶
         self.SetWindowStyle(wx.DEFAULT_FRAME_STYLE | wx.STAY_ON_TOP)
         self.SetWindowStyle(wx.DEFAULT_FRAME_STYLE)
+        
+        # 窗口显示之后再完成其余的启动步骤
+        wx.CallAfter(self.finish_startup)
+        
+    def finish_startup(self):
+        """窗口显示后执行的启动步骤, 完成时写出启动耗时"""
+        self.startup_timer.mark("显示窗口")
+        
+        # 后台导入openai并创建客户端, 完成后预热连接
+        started = time.perf_counter()
+        def on_clients_ready():
+            self.startup_timer.mark_background("创建OpenAI客户端", started)
+            wx.CallAfter(self.on_clients_ready)
+        self.config_manager.preload_clients(on_clients_ready)
+        
+        # 创建系统托盘图标
+        from .tray_icon import ChatTrayIcon
+        self.tray_icon = ChatTrayIcon(self)
+        self.startup_timer.mark("托盘图标")
+        
+        # 注册全局热键
+        self.hotkey_manager.setup_global_hotkey()
+        self.startup_timer.mark("注册热键")
+        
+        # 恢复上次的对话
+        self.restore_last_conversation()
+        self.startup_timer.mark("恢复对话")
+        
+        # 处理本次启动的命令行参数, 之后开始接收其他进程转发的命令
+        if self.initial_command is not None:
+            self.handle_command(self.initial_command)
+        if self.instance_server is not None:
+            self.instance_server.set_handler(self.on_ipc_command)
+        
+        budget = self.config.get('startup', {}).get('budget_ms', DEFAULT_BUDGET_MS)
+        self.startup_timer.report(budget)
+        
+    def on_clients_ready(self):
+        """默认客户端创建完成: 交给聊天客户端并预热连接"""
+        self.chat_client.set_client(self.config_manager.get_async_client())
+        self.prewarm_connections()
             
+    @property
+    def current_session(self):
+        """当前选中的标签页对应的会话(按页面查找, 关闭标签页的过程中也不会错位)"""
+        page = self.notebook.GetCurrentPage()
+        for session in self.sessions:
+            if session.history_panel is page:
+                return session
+        return None
+
+    @property
+    def history_panel(self):
+        return self.current_session.history_panel
+
+    @property
+    def chat_history(self):
+        return self.current_session.chat_history
+
+    @property
+    def current_agent(self):
+        return self.current_session.current_agent
+
+    def new_session(self, agent="default"):
+        """新建对话标签页并切换过去"""
+        self.session_count += 1
+        session = ChatSession(self.notebook, self.config, self.session_count, agent, self.conversation_store)
+        session.history_panel.Bind(wx.EVT_KEY_DOWN, self.OnHistoryKeyDown)
+        self.sessions.append(session)
+        self.notebook.AddPage(session.history_panel, session.title, select=True)
+        self.show_current_session()
+        return session
+
+    def close_session(self, session):
+        """关闭标签页, 取消该会话进行中的请求; 关闭最后一个时新建一个空会话"""
+        index = self.sessions.index(session)
+        session.close()
+        self.sessions.pop(index)
+        self.notebook.DeletePage(index)
+        if not self.sessions:
+            self.new_session(session.current_agent)
+        self.show_current_session()
+
+    def show_current_session(self):
+        """只有前台会话直接渲染, 后台会话缓存增量"""
+        current = self.current_session
+        if current is None:
+            return
+        for session in self.sessions:
+            if session is not current:
+                session.hide()
+        current.show()
+        self.UpdateLayout()
+
+    def restore_last_conversation(self):
+        """启动时在第一个标签页恢复最近的对话"""
+        if self.conversation_store is None:
+            return
+        last = self.conversation_store.last_conversation()
+        if last is None:
+            return
+        conversation_id, agent = last
+        if agent not in self.config['agents']:
+            agent = "default"
+        session = self.current_session
+        session.switch_agent(self.config, agent)
+        session.restore(conversation_id)
+        self.refresh_session_title(session)
+
+    def open_conversation(self, conversation_id, agent, message_id, query=""):
+        """跳转到保存的对话中的某条消息, 已打开且已加载时直接定位, 否则在新标签页中打开"""
+        for index, session in enumerate(self.sessions):
+            if session.conversation_id == conversation_id and message_id in session.message_texts:
+                self.notebook.SetSelection(index)
+                self.show_current_session()
+                session.focus_message(message_id, query)
+                return
+        if agent not in self.config['agents']:
+            agent = "default"
+        session = self.new_session(agent)
+        session.restore(conversation_id, from_message_id=message_id)
+        self.UpdateLayout()
+        wx.CallAfter(session.focus_message, message_id, query)
+
+    def OnSearch(self, event):
+        if self.conversation_store is None:
+            self.history_panel.add_message("System", "对话存储未开启, 无法搜索")
+            return
+        # 确保刚发送的消息已写入索引
+        self.conversation_store.flush(timeout=1)
+        from .ui import SearchDialog
+        dlg = SearchDialog(self, self.conversation_store)
+        if dlg.ShowModal() == wx.ID_OK and dlg.selection:
+            self.open_conversation(*dlg.selection)
+        dlg.Destroy()
+
+    def refresh_session_title(self, session):
+        self.notebook.SetPageText(self.sessions.index(session), session.title)
+
+    def OnPageChanged(self, event):
+        self.show_current_session()
+        event.Skip()
+
+    def OnNewTab(self, event):
+        self.new_session()
+        self.input_text.SetFocus()
+
+    def OnCloseTab(self, event):
+        self.close_session(self.current_session)
+        self.input_text.SetFocus()
+
+    def on_ipc_command(self, command):
+        """在IPC监听线程中检查命令, 有效的命令交给GUI线程执行"""
+        name = command.get('command')
+        if name == 'ask':
+            if not str(command.get('prompt', '')).strip():
+                raise ValueError("ask命令缺少prompt")
+            agent = command.get('agent')
+            if agent and agent not in self.config['agents']:
+                raise ValueError(f"agent不存在: {agent}")
+        elif name == 'open':
+            if not command.get('conversation_id'):
+                raise ValueError("open命令缺少conversation_id")
+            if self.conversation_store is None:
+                raise ValueError("对话存储未开启")
+        elif name != 'show':
+            raise ValueError(f"未知命令: {name}")
+        wx.CallAfter(self.handle_command, command)
+
+    def handle_command(self, command):
+        """执行命令行或IPC命令: show 显示窗口, ask 在新标签页中提问, open 打开保存的对话"""
+        self.show_window()
+        name = command.get('command')
+        if name == 'ask':
+            session = self.new_session(command.get('agent') or "default")
+            self.send_in_session(session, command['prompt'].strip())
+            self.UpdateLayout()
+        elif name == 'open':
+            self.open_saved_conversation(command['conversation_id'])
+
+    def open_saved_conversation(self, conversation_id):
+        """在新标签页中打开保存的对话(已打开时切换过去)"""
+        for index, session in enumerate(self.sessions):
+            if session.conversation_id == conversation_id:
+                self.notebook.SetSelection(index)
+                self.show_current_session()
+                return
+        agent = self.conversation_store.conversation_agent(conversation_id)
+        if agent is None:
+            self.history_panel.add_message("System", f"对话不存在: {conversation_id}")
+            return
+        if agent not in self.config['agents']:
+            agent = "default"
+        session = self.new_session(agent)
+        session.restore(conversation_id)
+        self.UpdateLayout()
+
     def safe_toggle_window(self):
         """线程安全的窗口切换"""
         wx.CallAfter(self.toggle_window)
@@ -86,10 +339,29 @@ class ChatFrame(wx.Frame):
         
         self.SetFocus()
         
+        # 窗口弹出时预热连接, 首条消息无需等待建连
+        self.prewarm_connections()
+        
         # 尝试置顶窗口
         self.SetWindowStyle(wx.DEFAULT_FRAME_STYLE | wx.STAY_ON_TOP)
         self.SetWindowStyle(wx.DEFAULT_FRAME_STYLE)
         
+    def prewarm_connections(self):
+        """在事件循环线程中预热API连接(保活期内重复调用会被忽略)
+
+        客户端还在后台创建时直接返回, 不让GUI线程等待openai导入; 创建完成后会预热。
+        """
+        if self.config_manager.async_client is None:
+            return
+        agent = self.config['agents'][self.current_agent]
+        for base_url in self.config_manager.get_endpoints(agent):
+            self.chat_client.run(self.config_manager.get_http_pool().prewarm(base_url))
+        
+    def OnInputText(self, event):
+        """用户开始输入时预热连接"""
+        self.prewarm_connections()
+        event.Skip()
+        
     def minimize_to_tray(self):
         """最小化到系统托盘"""
         self.Hide()
@@ -97,128 +369,299 @@ class ChatFrame(wx.Frame):
     def force_exit(self, event):
         """强制退出程序"""
         del self.hotkey_manager
-        self.tray_icon.Destroy()
+        self.queue_timer.Stop()
+        self.render_loop.stop()
+        self.chat_client.close()
+        self.config_manager.close()
+        if self.conversation_store is not None:
+            self.conversation_store.close()
+        if self.instance_server is not None:
+            self.instance_server.close()
+        if self.tray_icon is not None:
+            self.tray_icon.Destroy()
         self.Destroy()
         wx.GetApp().ExitMainLoop()
         
     def OnConfig(self, event):
-        dlg = ConfigDialog(self, self.config)
+        # 对话框在打开时才导入; 编辑配置的副本, 取消时不影响当前配置
+        from .ui import ConfigDialog
+        dlg = ConfigDialog(self, copy.deepcopy(self.config))
         if dlg.ShowModal() == wx.ID_OK:
-            self.config = self.config_manager.get_config()
-            # 重新设置全局热键
-            self.hotkey_manager.setup_global_hotkey()
+            self.config_manager.update_config(dlg.config)
         dlg.Destroy()
 
     def OnAgentConfig(self, event):
-        dlg = AgentConfigDialog(self, self.config)
-        if dlg.ShowModal() == wx.ID_OK:
-            self.config = self.config_manager.get_config()
-            # 重置聊天历史为当前agent的system role
-            self.chat_history = [
-                ("system", self.config['agents'][self.current_agent]['role_system'])
-            ]
+        from .ui import AgentConfigDialog
+        dlg = AgentConfigDialog(self, copy.deepcopy(self.config))
+        try:
+            if dlg.ShowModal() == wx.ID_OK:
+                self.config_manager.update_config(dlg.config)
+                # 重置当前会话的聊天历史为当前agent的system role, agent已被删除时回退到default
+                session = self.current_session
+                agent = session.current_agent if session.current_agent in self.config['agents'] else "default"
+                session.switch_agent(self.config, agent)
+                self.refresh_session_title(session)
+        finally:
+            dlg.Destroy()
+        
+    def on_config_changed(self, changed):
+        """配置段变化后在GUI线程中调用, 只重建受影响的部分"""
+        if changed & {'openai', 'providers'}:
+            # 在后台重新创建客户端, 不阻塞界面
+            self.config_manager.preload_clients(lambda: wx.CallAfter(self.on_clients_ready))
+        if changed & {'openai', 'rate_limits'}:
+            # 并发数、重试和限流规则对之后的请求立即生效; openai.pool 需要重启程序
+            self.chat_client.reconfigure(
+                max_concurrency=self.config['openai'].get('max_concurrency', 8),
+                retry=self.config['openai'].get('retry', {}),
+                rate_limits=self.config.get('rate_limits', [])
+            )
+        if 'hotkeys' in changed:
+            self.hotkey_manager.setup_global_hotkey()
+        if 'agents' in changed:
+            # 被删除的agent回退到default
+            for session in self.sessions:
+                if session.current_agent not in self.config['agents']:
+                    session.switch_agent(self.config, 'default')
+                    self.refresh_session_title(session)
+        
+    def OnQueueTimer(self, event):
+        """刷新状态栏中的排队数量, 没有变化时不重绘"""
+        depth = self.chat_client.rate_limiter.queue_depth()
+        if depth != self.queue_depth:
+            self.queue_depth = depth
+            self.SetStatusText(f"限流排队: {depth}" if depth else "")
+            
+    def OnStatistics(self, event):
+        from .ui import StatisticsDialog
+        dlg = StatisticsDialog(self)
+        dlg.ShowModal()
         dlg.Destroy()
         
     def OnClose(self, event):
         self.minimize_to_tray()
 
-    def check_for_agent(self, message):
-        """检查消息是否包含@nickname指令"""
+    def check_for_agent(self, message, session):
+        """检查消息是否包含@nickname指令, 只切换该会话的agent"""
         if message.startswith('@'):
             parts = message.split(' ', 1)
             nickname = parts[0][1:]  # 去掉@
             if nickname in self.config['agents']:
-                self.current_agent = nickname
-                # 重置聊天历史
-                self.chat_history = [
-                    ("system", self.config['agents'][nickname]['role_system'])
-                ]
+                # 切换agent并重置聊天历史
+                session.switch_agent(self.config, nickname)
+                self.refresh_session_title(session)
                 return parts[1] if len(parts) > 1 else ""
             else:
                 # 如果找不到指定的agent，使用default
-                self.current_agent = "default"
-                self.chat_history = [
-                    ("system", self.config['agents']['default']['role_system'])
-                ]
+                session.switch_agent(self.config, "default")
+                self.refresh_session_title(session)
         return message
 
-    def async_send_message(self, message):
-        """在后台线程中发送消息"""
+    def async_send_message(self, message, session=None):
+        """在GUI线程中准备请求并提交到异步客户端, 返回Future
+
+        回答完成后记录到会话历史; 请求失败时只显示系统消息, 错误不进入历史和对话存储。
+        """
+        future = Future()
+        session = session or self.current_session
         try:
             # 检查是否有@nickname指令
-            message = self.check_for_agent(message)
+            message = self.check_for_agent(message, session)
             if not message:
-                return "请输入消息内容"
+                session.history_panel.add_message("System", "请输入消息内容")
+                future.set_result(None)
+                return future
 
-            # 构建包含历史记录的消息列表
-            messages = []
-            for msg in self.chat_history:
-                messages.append({"role": msg[0], "content": msg[1]})
-            messages.append({"role": "user", "content": message})
+            # 使用该会话当前agent的上下文设置
+            agent = self.config['agents'][session.current_agent]
+            
+            # 记录用户消息(此时@指令已处理完毕), 并按token预算构建消息列表
+            session.record("user", "User", message)
+            messages = session.chat_history.build_messages(
+                max_tokens=agent.get('max_context_tokens'),
+                policy=agent.get('context_policy', 'drop_oldest'),
+                keep_last=agent.get('keep_last_messages', 20)
+            )
             
-            # 在主线程中创建消息面板
-            message_text = None
-            def create_panel():
-                nonlocal message_text
-                message_text = self.history_panel.create_message_panel("AI")
-            wx.CallAfter(create_panel)
+            # 当前处于主线程, 直接创建消息面板
+            message_text = session.history_panel.create_message_panel("AI")
             
-            # 等待面板创建完成
-            import time
-            time.sleep(0.1)
+            metrics = RequestMetrics(session.current_agent, agent['model'])
+            future = self.submit_for_agent(session.current_agent, messages, message_text, metrics, session)
+            # 记下历史的版本, 期间新建对话时丢弃这个回答
+            generation = session.chat_history.generation
+            future.add_done_callback(lambda f: self.on_session_reply(session, metrics, generation, f))
+            return future
             
-            # 使用当前agent的model
-            current_model = self.config['agents'][self.current_agent]['model']
+        except Exception as e:
+            session.history_panel.add_message("System", f"错误: {str(e)}")
+            future.set_result(None)
+            return future
+
+    def submit_for_agent(self, nickname, messages, message_text, metrics=None, session=None):
+        """按agent的模型、缓存和endpoint设置提交请求, 回答以增量形式追加到message_text"""
+        agent = self.config['agents'][nickname]
+        session = session or self.current_session
+        if metrics is None:
+            metrics = RequestMetrics(nickname, agent['model'])
+        
+        # 渲染目标绑定提交时的会话, 切换标签页后增量仍然写回原会话
+        target = (session, message_text)
+        
+        # 处理响应, 增量投递到渲染邮箱, 由GUI线程按帧合并应用
+        def update_message(delta):
+            self.render_loop.post(target, delta, metrics.flush_arrival, metrics)
             
-            # 获取聊天完成结果
-            response = self.chat_client.get_chat_completion(messages, current_model)
+        # 提交到事件循环线程, 不会阻塞其他请求
+        future = self.chat_client.submit(
+            messages, agent['model'], update_message,
+            use_cache=agent.get('cache', False),
+            clients=self.config_manager.get_async_clients(agent),
+            hedge=agent.get('hedge'),
+            metrics=metrics
+        )
+        
+        # 提交成功后才开始渲染节拍(取客户端或提交失败时不会留下空转的定时器);
+        # 节拍在GUI线程中运行, 此时不会错过已完成的流
+        self.render_loop.stream_started()
+        future.add_done_callback(lambda f: self.render_loop.stream_finished(target))
+        session.track(future)
+        return future
+        
+    def apply_stream_delta(self, target, text):
+        """渲染节拍回调: 前台会话追加到消息文本框, 后台会话只缓存"""
+        session, message_text = target
+        session.apply_delta(message_text, text)
+
+    def parse_fanout(self, message):
+        """解析 @a,b,c 或 @all 群发指令, 返回 (昵称列表, 问题, 未找到的昵称), 不是群发时返回None"""
+        if not message.startswith('@'):
+            return None
+        parts = message.split(' ', 1)
+        target = parts[0][1:]  # 去掉@
+        unknown = []
+        if target == 'all':
+            nicknames = list(self.config['agents'])
+        elif ',' in target:
+            names = [name.strip() for name in target.split(',') if name.strip()]
+            nicknames = [name for name in names if name in self.config['agents']]
+            unknown = [name for name in names if name not in self.config['agents']]
+        else:
+            return None
+        question = parts[1].strip() if len(parts) > 1 else ""
+        return nicknames, question, unknown
+
+    def fan_out_message(self, nicknames, question, unknown=(), session=None):
+        """把同一个问题并发发给多个agent, 每个回答显示在独立的消息中"""
+        session = session or self.current_session
+        if unknown:
+            # 拼错的昵称不静默忽略, 其余agent照常发送
+            session.history_panel.add_message("System", f"未找到agent: {', '.join(unknown)}")
+        if not nicknames:
+            if not unknown:
+                session.history_panel.add_message("System", "未找到指定的agent")
+            return
+        if not question:
+            session.history_panel.add_message("System", "请输入消息内容")
+            return
+        for nickname in nicknames:
+            self._fan_out_to_agent(nickname, question, session)
+
+    def _fan_out_to_agent(self, nickname, question, session):
+        """向单个agent发送群发问题, 完成后报告耗时"""
+        agent = self.config['agents'][nickname]
+        messages = [
+            {"role": "system", "content": agent['role_system']},
+            {"role": "user", "content": question}
+        ]
+        message_text = session.history_panel.create_message_panel(f"AI ({nickname})")
+        metrics = RequestMetrics(nickname, agent['model'])
             
-            # 处理响应
-            def update_message(text):
-                if message_text:
-                    wx.CallAfter(message_text.SetValue, text)
-                    wx.CallAfter(self.history_panel.update_message_text_size, message_text, text)
-                    
-            full_response = self.chat_client.process_stream_response(response, update_message)
-            return full_response
+        def on_complete(future):
+            try:
+                result = future.result()
+                # 失败由metrics记录, 正常回答也可能以"错误"开头
+                if metrics.error is not None:
+                    report = f"{nickname}: {result}"
+                else:
+                    first = "无"
+                    if metrics.first_token is not None:
+                        first = f"{metrics.first_token - metrics.start:.2f}秒"
+                    report = f"{nickname}: 首字 {first}, 总耗时 {metrics.end - metrics.start:.2f}秒"
+            except Exception as e:
+                report = f"{nickname}: 错误: {str(e)}"
+            wx.CallAfter(self.add_session_message, session, report)
             
-        except Exception as e:
-            return f"错误: {str(e)}"
+        self.submit_for_agent(nickname, messages, message_text, metrics, session).add_done_callback(on_complete)
+
+    def add_session_message(self, session, text):
+        """在GUI线程中向会话追加系统消息, 会话已关闭时忽略"""
+        if not session.closed:
+            session.history_panel.add_message("System", text)
 
     def OnSend(self, event):
         message = self.input_text.GetValue().strip()
         if not message:
             return
             
-        # 显示用户消息
-        self.history_panel.add_message("User", message)
-        self.chat_history.append(("user", message))
         self.input_text.SetValue("")
+        # 请求归属于发送时的会话, 之后切换标签页不影响
+        self.send_in_session(self.current_session, message)
+
+    def send_in_session(self, session, message):
+        """在指定会话中显示并发送用户消息"""
+        session.history_panel.add_message("User", message)
+        
+        # 群发模式: 不影响当前agent和聊天历史
+        fanout = self.parse_fanout(message)
+        if fanout is not None:
+            self.fan_out_message(*fanout, session=session)
+            return
         
-        def on_complete(future):
-            """处理异步调用完成"""
-            try:
-                ai_message = future.result()
-                self.chat_history.append(("assistant", ai_message))
-                # 将焦点移动到最新的消息文本框
-                if self.history_panel.latest_message_text:
-                    wx.CallAfter(self.history_panel.latest_message_text.SetFocus)
-            except Exception as e:
-                wx.CallAfter(self.history_panel.add_message, "System", f"错误: {str(e)}")
-        
-        # 在线程池中执行API调用
-        future = self.thread_pool.submit(self.async_send_message, message)
-        future.add_done_callback(on_complete)
+        # 提交到异步客户端执行API调用
+        self.async_send_message(message, session)
+
+    def on_session_reply(self, session, metrics, generation, future):
+        """请求完成(任意线程): 成功的回答交给GUI线程记录, 失败时显示系统消息"""
+        if future.cancelled():
+            # 标签页已关闭或已新建对话
+            return
+        try:
+            ai_message = future.result()
+        except Exception as e:
+            wx.CallAfter(self.add_session_message, session, f"错误: {str(e)}")
+            return
+        # 失败由metrics记录, 错误文字不作为回答保存, 也不会作为上下文再发给模型
+        if metrics.error is not None:
+            wx.CallAfter(self.add_session_message, session, f"错误: {str(metrics.error)}")
+            return
+        # 历史记录只在主线程中修改
+        wx.CallAfter(self.finish_session_reply, session, ai_message, generation)
+
+    def finish_session_reply(self, session, ai_message, generation=None):
+        """记录回答到会话历史, 会话在前台时把焦点移动到最新的消息文本框
+
+        generation 为发送时聊天历史的版本, 之后历史被重置(新建对话、切换agent)时不再记录。
+        """
+        if session.closed:
+            return
+        if generation is not None and generation != session.chat_history.generation:
+            return
+        session.record("assistant", "AI", ai_message)
+        # 历史过长时在后台把最旧的轮次合并进摘要
+        self.compactor.maybe_compact(session.chat_history, self.config['agents'][session.current_agent])
+        if session is self.current_session and session.history_panel.latest_message_text:
+            session.history_panel.latest_message_text.SetFocus()
             
     def OnNew(self, event):
-        """清空历史聊天记录"""
+        """清空界面并开始新对话, 之前的对话仍保存在对话存储中"""
+        # 进行中的回答属于旧对话, 取消后不会再写入新的历史
+        self.current_session.cancel_inflight()
         self.history_panel.clear_history()
         # 清空输入框
         self.input_text.SetValue("")
         # 重置聊天历史为当前agent的system role
-        self.chat_history = [
-            ("system", self.config['agents'][self.current_agent]['role_system'])
-        ]
+        self.current_session.switch_agent(self.config, self.current_agent)
         # 更新布局
         self.UpdateLayout()
             
@@ -273,6 +716,19 @@ class ChatFrame(wx.Frame):
             self.OnNew(event)
             return
             
+        # 处理 Ctrl+T / Ctrl+W 新建和关闭标签页
+        if event.ControlDown() and key_code == ord('T'):
+            self.OnNewTab(event)
+            return
+        if event.ControlDown() and key_code == ord('W'):
+            self.OnCloseTab(event)
+            return
+            
+        # 处理 Ctrl+F 搜索历史对话
+        if event.ControlDown() and key_code == ord('F'):
+            self.OnSearch(event)
+            return
+            
         # 处理其他按键
         if event.AltDown():
             if key_code == wx.WXK_F4:  # Alt+F4
@@ -294,14 +750,22 @@ class ChatFrame(wx.Frame):
         # 创建菜单栏
         menubar = wx.MenuBar()
         fileMenu = wx.Menu()
+        newTabItem = fileMenu.Append(-1, '新建标签页(&B)')
+        closeTabItem = fileMenu.Append(-1, '关闭标签页(&W)')
+        fileMenu.AppendSeparator()
         configItem = fileMenu.Append(-1, '配置(&S)')
         agentItem = fileMenu.Append(-1, '添加agent(&A)')
+        searchItem = fileMenu.Append(-1, '搜索对话(&R)')
+        statsItem = fileMenu.Append(-1, '统计(&T)')
         exitItem = fileMenu.Append(-1, '退出(&X)')
         menubar.Append(fileMenu, '文件(&F)')
         self.SetMenuBar(menubar)
         
-        # 消息历史面板
-        self.history_panel = MessagePanel(panel)
+        # 状态栏显示请求排队情况
+        self.CreateStatusBar()
+        
+        # 对话标签页, 每页是一个会话的消息历史面板
+        self.notebook = wx.Notebook(panel)
         
         # 输入面板 - 固定高度
         self.input_panel = wx.Panel(panel)
@@ -348,19 +812,24 @@ class ChatFrame(wx.Frame):
         self.input_panel.SetSizer(input_sizer)
         
         # 设置主布局
-        main_sizer.Add(self.history_panel, 1, wx.EXPAND | wx.ALL, 5)  # 历史面板占用所有剩余空间
+        main_sizer.Add(self.notebook, 1, wx.EXPAND | wx.ALL, 5)  # 标签页占用所有剩余空间
         main_sizer.Add(self.input_panel, 0, wx.EXPAND | wx.LEFT | wx.RIGHT | wx.BOTTOM, 5)  # 输入面板固定在底部
         
         panel.SetSizer(main_sizer)
         
         # 绑定事件
+        self.Bind(wx.EVT_MENU, self.OnNewTab, newTabItem)
+        self.Bind(wx.EVT_MENU, self.OnCloseTab, closeTabItem)
         self.Bind(wx.EVT_MENU, self.OnConfig, configItem)
         self.Bind(wx.EVT_MENU, self.OnAgentConfig, agentItem)
+        self.Bind(wx.EVT_MENU, self.OnSearch, searchItem)
+        self.Bind(wx.EVT_MENU, self.OnStatistics, statsItem)
         self.Bind(wx.EVT_MENU, self.force_exit, exitItem)
         self.send_btn.Bind(wx.EVT_BUTTON, self.OnSend)
         new_btn.Bind(wx.EVT_BUTTON, self.OnNew)
         self.input_text.Bind(wx.EVT_KEY_DOWN, self.OnKeyDown)
-        self.history_panel.Bind(wx.EVT_KEY_DOWN, self.OnHistoryKeyDown)
+        self.input_text.Bind(wx.EVT_TEXT, self.OnInputText)
+        self.notebook.Bind(wx.EVT_NOTEBOOK_PAGE_CHANGED, self.OnPageChanged)
         
         # 绑定按键事件
         self.Bind(wx.EVT_CHAR_HOOK, self.OnKeyPress)
@@ -368,14 +837,14 @@ class ChatFrame(wx.Frame):
         # 绑定窗口显示事件
         self.Bind(wx.EVT_SHOW, self.OnShow)
         
+        # 创建第一个会话
+        self.new_session()
+        
         # 强制更新布局
         self.input_panel.Layout()
-        self.history_panel.Layout()
         panel.Layout()
         
     def UpdateLayout(self):
         """强制更新所有面板的布局"""
-        self.history_panel.Layout()
-        self.history_panel.SetupScrolling(scroll_x=False, scroll_y=True, rate_y=20)
-        self.history_panel.FitInside()  # 确保内容适应面板大小
+        self.history_panel.refresh_layout()  # 重新计算消息位置并刷新可见范围
         self.Layout()
@@ -0,0 +1,134 @@
+from .context_window import ContextWindow
+from .message_panel import MessagePanel
+
+class ChatSession:
+    """一个独立的对话标签页
+
+    拥有自己的聊天历史、当前agent、消息面板和进行中的请求。
+    所有会话共用同一个 AsyncChatClient 事件循环并发执行。
+    不在前台的会话继续接收增量, 但只缓存不渲染, 切换回来时一次性追加。
+    配置了对话存储时, 用户消息和回答会持久化, 滚动到顶部时按页加载更早的消息。
+    """
+
+    def __init__(self, notebook, config, number, agent="default", store=None):
+        self.number = number
+        self.current_agent = agent
+        self.chat_history = ContextWindow(config['agents'][agent]['role_system'])
+        self.history_panel = MessagePanel(notebook)
+        self.history_panel.on_reach_top = self.load_older
+        self.store = store
+        self.conversation_id = None
+        self.oldest_id = None
+        self.message_texts = {}
+        self.inflight = set()
+        self.hidden_deltas = {}
+        self.visible = False
+        self.closed = False
+
+    @property
+    def title(self):
+        return f"对话{self.number} ({self.current_agent})"
+
+    def switch_agent(self, config, nickname):
+        """切换agent并重置历史, 之后的消息记入新的对话"""
+        self.current_agent = nickname
+        self.chat_history.reset(config['agents'][nickname]['role_system'])
+        self.conversation_id = None
+        self.oldest_id = None
+        self.message_texts = {}
+
+    def record(self, role, sender, content):
+        """记录一条消息到聊天历史和对话存储"""
+        self.chat_history.append(role, content)
+        if self.store is None:
+            return
+        if self.conversation_id is None:
+            self.conversation_id = self.store.create_conversation(self.current_agent)
+        self.store.append_message(self.conversation_id, role, sender, content)
+
+    def restore(self, conversation_id, from_message_id=None):
+        """恢复已保存的对话, 只有最近一页消息加入发送的上下文
+
+        指定from_message_id且该消息早于最近一页时, 另外在上方显示它附近的一页
+        (只用于显示, 与 load_older 相同), 两页之间的消息省略。
+        """
+        rows = self.store.load_page(conversation_id)
+        self.conversation_id = conversation_id
+        if not rows:
+            return
+        for _, role, _, content in rows:
+            self.chat_history.append(role, content)
+        self._show_rows(rows)
+        self.oldest_id = rows[0][0]
+        if from_message_id is not None and from_message_id < self.oldest_id:
+            page = self.store.load_from(conversation_id, from_message_id)
+            nearby = [row for row in page if row[0] < self.oldest_id]
+            if len(nearby) == len(page):
+                # 没有与最近一页相接
+                self.history_panel.prepend_messages([("System", "…… 中间的消息已省略 ……")])
+            if nearby:
+                self.oldest_id = nearby[0][0]
+                self._show_rows(nearby)
+        self.history_panel.scroll_to_bottom()
+
+    def _show_rows(self, rows):
+        """在面板顶部插入已保存的消息, 并记录消息id对应的文本框"""
+        message_texts = self.history_panel.prepend_messages(
+            [(sender, content) for _, _, sender, content in rows])
+        for row, message_text in zip(rows, message_texts):
+            self.message_texts[row[0]] = message_text
+
+    def focus_message(self, message_id, query=""):
+        """跳转到已加载的某条消息, 返回是否找到"""
+        message_text = self.message_texts.get(message_id)
+        if message_text is None:
+            return False
+        self.history_panel.focus_message(message_text, query)
+        return True
+
+    def load_older(self):
+        """滚动到顶部时加载更早的一页(只用于显示, 不加入发送的上下文)"""
+        if self.store is None or self.oldest_id is None:
+            return
+        rows = self.store.load_page(self.conversation_id, before_id=self.oldest_id)
+        if not rows:
+            # 已经到最早的消息
+            self.oldest_id = None
+            return
+        self.oldest_id = rows[0][0]
+        self._show_rows(rows)
+
+    def track(self, future):
+        """记录进行中的请求, 完成后自动移除"""
+        self.inflight.add(future)
+        future.add_done_callback(self.inflight.discard)
+
+    def apply_delta(self, message_text, text):
+        """应用增量: 前台直接渲染, 后台只缓存"""
+        if self.closed:
+            return
+        if self.visible:
+            self.history_panel.append_message_text(message_text, text)
+        else:
+            self.hidden_deltas.setdefault(message_text, []).append(text)
+
+    def show(self):
+        """切换到前台, 把后台期间缓存的增量一次性追加"""
+        self.visible = True
+        hidden, self.hidden_deltas = self.hidden_deltas, {}
+        for message_text, parts in hidden.items():
+            self.history_panel.append_message_text(message_text, "".join(parts))
+
+    def hide(self):
+        self.visible = False
+
+    def cancel_inflight(self):
+        """取消进行中的请求, 丢弃尚未渲染的增量"""
+        for future in list(self.inflight):
+            future.cancel()
+        self.hidden_deltas = {}
+
+    def close(self):
+        """关闭会话并取消进行中的请求"""
+        self.closed = True
+        self.cancel_inflight()
@@ -1,19 +1,53 @@
+import copy
 import json
 import os
-from openai import OpenAI
+import tempfile
+import threading
+from .logger_manager import LoggerManager
+
+# 合并保存的等待时间(秒), 连续修改只在最后一次修改之后写一次文件
+SAVE_DELAY = 0.5
+# 检查配置文件是否被外部修改的间隔(秒)
+WATCH_INTERVAL = 1.0
 
 class ConfigManager:
-    def __init__(self):
+    """配置的唯一存储
+
+    所有修改通过 update_config 提交: 只比较顶层配置段, 原地替换有变化的段
+    (其他模块持有的配置字典仍然有效), 并通知监听者哪些段发生了变化。
+    保存经过防抖合并, 先写临时文件再重命名, 写到一半退出也不会损坏配置文件。
+    start_watching 后台检查配置文件, 外部编辑同样按段生效, 自己写入的文件不会触发重新加载。
+
+    openai SDK 和 HTTP连接池在第一次需要客户端时才导入和创建, 启动时可以用
+    preload_clients 放到后台线程中完成, 不占用显示窗口之前的时间。
+    """
+
+    def __init__(self, config_path='config.json'):
+        self.logger = LoggerManager.get_logger()
+        self.config_path = config_path
+        self.lock = threading.RLock()
+        self.listeners = []
+        self.save_timer = None
+        self.watcher = None
+        self.watch_stopped = threading.Event()
         self.config = self.load_config()
-        self.client = self.init_openai_client()
+        self.file_signature = self._signature()
+        LoggerManager().configure(self.config.get('logging'))
+        self.client_lock = threading.Lock()
+        self.http_pool = None
+        self.client = None
+        self.async_client = None
+        self.providers = None
+        self.async_runner = None
         
     def load_config(self):
         """加载配置文件,如果不存在则创建默认配置"""
-        if not os.path.exists('config.json'):
+        if not os.path.exists(self.config_path):
             default_config = {
                 'openai': {
                     'api_key': '',
                     'base_url': 'https://api.openai.com/v1',
+                    'max_concurrency': 8,
                 },
                 'hotkeys': {
                     'show_window': 'alt+z'
@@ -26,24 +60,140 @@ class ConfigManager:
                     }
                 }
             }
-            with open('config.json', 'w', encoding='utf-8') as f:
-                json.dump(default_config, f, indent=4)
+            self._write_file(default_config)
             return default_config
             
-        with open('config.json', 'r', encoding='utf-8') as f:
+        with open(self.config_path, 'r', encoding='utf-8') as f:
             return json.load(f)
             
+    def load_clients(self):
+        """导入openai SDK并创建连接池、provider注册表和默认客户端, 已创建时直接返回"""
+        with self.client_lock:
+            if self.async_client is not None:
+                return
+            from .http_pool import HttpPool
+            from .provider_registry import ProviderRegistry
+            if self.http_pool is None:
+                self.http_pool = HttpPool(**self.config['openai'].get('pool', {}))
+            if self.providers is None:
+                self.providers = ProviderRegistry(self.config, self.http_pool)
+                self.providers.async_runner = self.async_runner
+            self.client = self.init_openai_client()
+            self.async_client = self.providers.get_async_client()
+
+    def preload_clients(self, on_ready=None):
+        """在后台线程中创建客户端, 完成后调用 on_ready()"""
+        def run():
+            try:
+                self.load_clients()
+            except Exception as e:
+                self.logger.error(f"初始化OpenAI客户端失败: {str(e)}")
+                return
+            if on_ready is not None:
+                on_ready()
+        thread = threading.Thread(target=run, name="ClientPreload", daemon=True)
+        thread.start()
+        return thread
+
     def init_openai_client(self):
         """初始化OpenAI客户端"""
+        from openai import OpenAI
+        base_url = self.config['openai']['base_url']
         return OpenAI(
             api_key=self.config['openai']['api_key'],
-            base_url=self.config['openai']['base_url']
+            base_url=base_url,
+            http_client=self.http_pool.get_client(base_url)
         )
         
+    def _signature(self):
+        """配置文件的修改时间和大小, 文件不存在时为None"""
+        try:
+            stat = os.stat(self.config_path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _write_file(self, config):
+        """先写同目录下的临时文件再替换, 替换是原子操作"""
+        directory = os.path.dirname(os.path.abspath(self.config_path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.config-', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(config, f, indent=4, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.config_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
     def save_config(self):
-        """保存配置到文件"""
-        with open('config.json', 'w', encoding='utf-8') as f:
-            json.dump(self.config, f, indent=4)
+        """立即保存配置到文件, 并取消尚未执行的延迟保存"""
+        with self.lock:
+            if self.save_timer is not None:
+                self.save_timer.cancel()
+                self.save_timer = None
+            snapshot = copy.deepcopy(self.config)
+            self._write_file(snapshot)
+            self.file_signature = self._signature()
+
+    def schedule_save(self, delay=SAVE_DELAY):
+        """延迟保存, 在delay秒内的多次修改合并为一次写入"""
+        with self.lock:
+            if self.save_timer is not None:
+                self.save_timer.cancel()
+            self.save_timer = threading.Timer(delay, self._save_pending)
+            self.save_timer.daemon = True
+            self.save_timer.start()
+
+    def _save_pending(self):
+        try:
+            self.save_config()
+        except OSError as e:
+            self.logger.error(f"保存配置失败: {str(e)}")
+
+    def add_listener(self, callback):
+        """注册配置变化的回调 callback(changed_sections), 可能在后台线程中调用"""
+        self.listeners.append(callback)
+
+    def start_watching(self, interval=WATCH_INTERVAL):
+        """启动后台线程检查配置文件的外部修改"""
+        if self.watcher is not None:
+            return
+        self.watch_stopped.clear()
+        self.watcher = threading.Thread(target=self._watch_loop, args=(interval,),
+                                        name="ConfigWatcher", daemon=True)
+        self.watcher.start()
+
+    def _watch_loop(self, interval):
+        while not self.watch_stopped.wait(interval):
+            self.reload_if_changed()
+
+    def reload_if_changed(self):
+        """配置文件被外部修改时重新加载, 返回变化的配置段"""
+        with self.lock:
+            signature = self._signature()
+            if signature is None or signature == self.file_signature:
+                return set()
+            try:
+                with open(self.config_path, 'r', encoding='utf-8') as f:
+                    new_config = json.load(f)
+            except (OSError, ValueError) as e:
+                # 编辑器可能正在写入, 下次检查时再读
+                self.logger.warning(f"读取外部修改的配置失败: {str(e)}")
+                return set()
+            self.file_signature = signature
+            self.logger.info("检测到配置文件被外部修改, 重新加载")
+            return self._apply(new_config)
+
+    def close(self):
+        """停止检查外部修改, 并写入尚未保存的修改"""
+        self.watch_stopped.set()
+        with self.lock:
+            pending = self.save_timer is not None
+        if pending:
+            self.save_config()
             
     def get_config(self):
         """获取当前配置"""
@@ -51,10 +201,71 @@ class ConfigManager:
         
     def get_client(self):
         """获取OpenAI客户端"""
+        self.load_clients()
         return self.client
         
+    def get_async_client(self, base_url=None):
+        """获取默认provider的AsyncOpenAI客户端, 指定base_url时返回该endpoint的客户端"""
+        self.load_clients()
+        # 每次从注册表取, 空闲回收后会重新创建
+        return self.providers.get_async_client(base_url=base_url)
+
+    def get_http_pool(self):
+        """获取共享的HTTP连接池"""
+        self.load_clients()
+        return self.http_pool
+        
+    def get_endpoints(self, agent):
+        """获取agent可用的endpoint列表, 依次为agent配置、provider配置和provider的base_url"""
+        self.load_clients()
+        return self.providers.endpoints(agent)
+        
+    def get_async_clients(self, agent):
+        """获取agent所用provider在各endpoint上的AsyncOpenAI客户端, 第一个为首选"""
+        self.load_clients()
+        return self.providers.get_async_clients(agent)
+
+    def set_async_runner(self, runner):
+        """设置在客户端所属事件循环中执行协程的函数, 用于关闭回收的连接池"""
+        self.async_runner = runner
+        if self.providers is not None:
+            self.providers.async_runner = runner
+        
     def update_config(self, new_config):
-        """更新配置"""
-        self.config = new_config
-        self.client = self.init_openai_client()
-        self.save_config()
+        """提交修改后的配置(可以是get_config的深拷贝), 延迟保存并返回变化的配置段"""
+        with self.lock:
+            changed = self._apply(new_config)
+        if changed:
+            self.schedule_save()
+        return changed
+
+    def _apply(self, new_config):
+        """按顶层配置段比较并原地替换, 只重建受影响的部分, 最后通知监听者"""
+        changed = {key for key in set(self.config) | set(new_config)
+                   if self.config.get(key) != new_config.get(key)}
+        if not changed:
+            return changed
+        if self.config.get('openai', {}).get('pool') != new_config.get('openai', {}).get('pool'):
+            # 连接池在启动时创建并被所有客户端共享, 运行中不重建
+            self.logger.warning("openai.pool 的修改需要重启程序后生效")
+        for key in changed:
+            if key in new_config:
+                self.config[key] = copy.deepcopy(new_config[key])
+            else:
+                del self.config[key]
+        if 'logging' in changed:
+            LoggerManager().configure(self.config.get('logging'))
+        if changed & {'openai', 'providers'}:
+            # 只有连接配置变化时才重建客户端, 尚未创建时等第一次使用再创建
+            with self.client_lock:
+                self.client = None
+                self.async_client = None
+                if self.providers is not None:
+                    self.providers.clear()
+        self.logger.info(f"配置已更新: {', '.join(sorted(changed))}")
+        for callback in list(self.listeners):
+            try:
+                callback(changed)
+            except Exception as e:
+                self.logger.error(f"配置变化回调失败: {str(e)}")
+        return changed
@@ -0,0 +1,151 @@
+def estimate_tokens(text):
+    """粗略估算文本的token数量
+
+    中日韩字符大约每个字一个token, 其他字符大约每4个字符一个token,
+    另加每条消息固定的格式开销。
+    """
+    cjk = 0
+    for ch in text:
+        code = ord(ch)
+        if (0x4E00 <= code <= 0x9FFF or 0x3400 <= code <= 0x4DBF or
+                0x3040 <= code <= 0x30FF or 0xAC00 <= code <= 0xD7AF or
+                0xFF00 <= code <= 0xFFEF or 0x3000 <= code <= 0x303F):
+            cjk += 1
+    other = len(text) - cjk
+    return cjk + (other + 3) // 4 + 4
+
+
+class ContextWindow:
+    """带token预算的聊天历史
+
+    每条消息的token数只在添加时计算一次, 总数增量维护。
+    发送请求时按策略裁剪:
+        drop_oldest: 超出预算时从最旧的消息开始丢弃
+        keep_last:   只保留system消息、固定消息和最近N条消息
+    丢弃用户消息时连同它的回答一起丢弃, 发送的上下文中不会出现没有提问的回答。
+    system消息和被固定(pinned)的消息永远不会被裁剪。
+
+    设置摘要后, 已被摘要覆盖的旧消息在发送时替换为一条摘要消息,
+    原始消息仍保留在历史中(界面和存储不受影响)。
+    """
+
+    POLICIES = ('drop_oldest', 'keep_last')
+
+    def __init__(self, system_prompt):
+        # 每次重置加一, 后台摘要完成时据此判断历史是否已被清空
+        self.generation = 0
+        self.reset(system_prompt)
+
+    def reset(self, system_prompt):
+        """清空历史, 只保留system消息"""
+        # 每项为 [role, content, tokens, pinned]
+        self.entries = []
+        self.total_tokens = 0
+        self.generation += 1
+        # 摘要覆盖 entries[1:summarized] 中的普通消息
+        self.summary = None
+        self.summary_tokens = 0
+        self.summarized = 1
+        self.summarized_tokens = 0
+        self.append("system", system_prompt, pinned=True)
+
+    def append(self, role, content, pinned=False):
+        """添加一条消息并返回其索引"""
+        tokens = estimate_tokens(content)
+        self.entries.append([role, content, tokens, pinned])
+        self.total_tokens += tokens
+        return len(self.entries) - 1
+
+    def pin(self, index, pinned=True):
+        """固定或取消固定某条消息"""
+        self.entries[index][3] = pinned
+
+    def context_tokens(self):
+        """用摘要替换旧消息后发送的token数(裁剪前)"""
+        return self.total_tokens - self.summarized_tokens + self.summary_tokens
+
+    def pending_summary(self, keep_last):
+        """尚未被摘要覆盖、且不在最近keep_last条之内的消息, 返回 (截止索引, 消息列表)"""
+        upto = max(self.summarized, len(self.entries) - keep_last)
+        messages = [
+            (role, content) for role, content, _, pinned in self.entries[self.summarized:upto]
+            if role != "system" and not pinned
+        ]
+        return upto, messages
+
+    def set_summary(self, summary, upto):
+        """用新的摘要覆盖 entries[1:upto] 中的普通消息"""
+        if upto <= self.summarized:
+            return
+        for role, _, tokens, pinned in self.entries[self.summarized:upto]:
+            if role != "system" and not pinned:
+                self.summarized_tokens += tokens
+        self.summarized = upto
+        self.summary = summary
+        self.summary_tokens = estimate_tokens(summary)
+
+    def __iter__(self):
+        for role, content, _, _ in self.entries:
+            yield (role, content)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def build_messages(self, max_tokens=None, policy='drop_oldest', keep_last=20):
+        """按预算和策略构建发送给模型的消息列表"""
+        if policy not in self.POLICIES:
+            raise ValueError(f"未知的上下文裁剪策略: {policy}")
+
+        last_index = len(self.entries) - 1
+        keep = [True] * len(self.entries)
+        total = self.context_tokens()
+
+        def protected(i):
+            role, _, _, pinned = self.entries[i]
+            return role == "system" or pinned or i == last_index
+
+        def drop(i):
+            """丢弃一条消息; 丢弃用户消息时连同紧随其后的回答一起丢弃, 不留下没有提问的回答"""
+            nonlocal total
+            keep[i] = False
+            total -= self.entries[i][2]
+            if self.entries[i][0] != "user":
+                return
+            for j in range(i + 1, len(self.entries)):
+                if self.entries[j][0] != "assistant":
+                    break
+                if keep[j] and not protected(j):
+                    keep[j] = False
+                    total -= self.entries[j][2]
+
+        # 已被摘要覆盖的消息不再发送
+        for i in range(1, self.summarized):
+            if not protected(i):
+                keep[i] = False
+
+        # keep_last: 先丢弃最近N条之外的普通消息
+        if policy == 'keep_last':
+            recent = 0
+            for i in range(last_index, -1, -1):
+                if protected(i) or not keep[i]:
+                    continue
+                recent += 1
+                if recent > keep_last:
+                    drop(i)
+
+        # 超出预算时从最旧的消息开始丢弃
+        if max_tokens is not None:
+            for i in range(len(self.entries)):
+                if total <= max_tokens:
+                    break
+                if keep[i] and not protected(i):
+                    drop(i)
+
+        messages = [
+            {"role": role, "content": content}
+            for (role, content, _, _), kept in zip(self.entries, keep) if kept
+        ]
+        if self.summary:
+            # 摘要紧跟在最前面的system消息之后
+            messages.insert(1, {"role": "system", "content": f"之前对话的摘要:\n{self.summary}"})
+        return messages
@@ -0,0 +1,251 @@
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from .logger_manager import LoggerManager
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    agent TEXT NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    sender TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages (conversation_id, id);
+CREATE INDEX IF NOT EXISTS idx_conversations_updated ON conversations (updated);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (content, tokenize = 'unicode61');
+"""
+
+# 中日韩文字没有空格分词, 连续的一段按二元组切分后再交给FTS5
+CJK_RUN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+')
+
+def segment_text(text):
+    """把中日韩文字切成重叠的二元组, 其他文字保持原样由unicode61分词
+
+    每段的最后一个字额外作为单字索引, 这样单字查询用前缀匹配即可覆盖所有位置。
+    """
+    def split_run(match):
+        run = match.group(0)
+        grams = [run[i:i + 2] for i in range(len(run) - 1)]
+        grams.append(run[-1])
+        return f" {' '.join(grams)} "
+    return CJK_RUN.sub(split_run, text or "")
+
+def build_match_query(query):
+    """把用户输入转换为FTS5查询: 中文片段按二元组短语匹配, 其他词按前缀匹配, 各部分之间为AND"""
+    terms = []
+    position = 0
+    for match in CJK_RUN.finditer(query):
+        terms.extend(f'"{word}"*' for word in re.findall(r'\w+', query[position:match.start()]))
+        run = match.group(0)
+        if len(run) == 1:
+            terms.append(f'"{run}"*')
+        else:
+            terms.append('"' + ' '.join(run[i:i + 2] for i in range(len(run) - 1)) + '"')
+        position = match.end()
+    terms.extend(f'"{word}"*' for word in re.findall(r'\w+', query[position:]))
+    return ' '.join(terms)
+
+# 写线程每批最多合并的操作数
+BATCH_SIZE = 200
+
+class ConversationStore:
+    """基于SQLite(WAL模式)的对话存储
+
+    消息只追加不修改。写操作投递到队列, 由后台写线程按批在一个事务中提交,
+    GUI线程不等待磁盘; 读操作使用独立连接, WAL模式下不会被写事务阻塞。
+    对话id在本地生成, 创建对话时无需等待数据库返回。
+    """
+
+    def __init__(self, db_path=None, page_size=50):
+        self.logger = LoggerManager.get_logger()
+        self.page_size = page_size
+
+        # 数据库默认放在与logs目录同级的data目录
+        if db_path is None:
+            db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'conversations.db')
+        directory = os.path.dirname(os.path.abspath(db_path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.db_path = db_path
+
+        # 先在当前线程建表, 之后读写连接都可以直接使用
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        self._backfill_index(conn)
+        conn.commit()
+        self.read_conn = conn
+        self.read_lock = threading.Lock()
+
+        self.queue = queue.Queue()
+        self.writer = threading.Thread(target=self._write_loop, name="ConversationStoreWriter", daemon=True)
+        self.writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.create_function("segment_text", 1, segment_text, deterministic=True)
+        return conn
+
+    def _backfill_index(self, conn):
+        """为建立全文索引之前保存的消息补建索引"""
+        cursor = conn.execute(
+            "INSERT INTO messages_fts (rowid, content) "
+            "SELECT id, segment_text(content) FROM messages "
+            "WHERE id > (SELECT IFNULL(MAX(rowid), 0) FROM messages_fts) AND role IN ('user', 'assistant')"
+        )
+        if cursor.rowcount > 0:
+            self.logger.info(f"已为{cursor.rowcount}条历史消息建立全文索引")
+
+    def _write_loop(self):
+        """后台写线程: 阻塞等待第一条操作, 再取出已排队的操作一起提交"""
+        conn = self._connect()
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(item is None for item in batch)
+            statements = [item for item in batch if isinstance(item, tuple)]
+            try:
+                with conn:
+                    for statement in statements:
+                        conn.execute(*statement)
+            except sqlite3.Error as e:
+                # 整批已回滚, 逐条重试, 只丢弃本身失败的操作
+                self.logger.error(f"批量写入对话记录失败({len(statements)}条操作), 逐条重试: {str(e)}")
+                for statement in statements:
+                    try:
+                        with conn:
+                            conn.execute(*statement)
+                    except sqlite3.Error as e:
+                        self.logger.error(f"写入对话记录失败, 已丢弃: {statement[0]} {str(e)}")
+            # 事务提交后再通知等待flush的线程
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+                self.queue.task_done()
+            if stop:
+                break
+        conn.close()
+
+    def create_conversation(self, agent):
+        """新建对话, 立即返回对话id"""
+        conversation_id = uuid.uuid4().hex
+        now = time.time()
+        self.queue.put((
+            "INSERT INTO conversations (id, agent, created, updated) VALUES (?, ?, ?, ?)",
+            (conversation_id, agent, now, now)
+        ))
+        return conversation_id
+
+    def append_message(self, conversation_id, role, sender, content):
+        """追加一条消息(不阻塞调用线程)"""
+        now = time.time()
+        self.queue.put((
+            "INSERT INTO messages (conversation_id, role, sender, content, created) VALUES (?, ?, ?, ?, ?)",
+            (conversation_id, role, sender, content, now)
+        ))
+        if role in ('user', 'assistant'):
+            # 同一连接中紧跟在插入之后, last_insert_rowid即为这条消息的id
+            self.queue.put((
+                "INSERT INTO messages_fts (rowid, content) VALUES (last_insert_rowid(), segment_text(?))",
+                (content,)
+            ))
+        self.queue.put((
+            "UPDATE conversations SET updated = ? WHERE id = ?",
+            (now, conversation_id)
+        ))
+
+    def last_conversation(self):
+        """最近更新且有消息的对话, 返回 (id, agent), 没有时返回None"""
+        with self.read_lock:
+            return self.read_conn.execute(
+                "SELECT id, agent FROM conversations c "
+                "WHERE EXISTS (SELECT 1 FROM messages m WHERE m.conversation_id = c.id) "
+                "ORDER BY updated DESC LIMIT 1"
+            ).fetchone()
+
+    def conversation_agent(self, conversation_id):
+        """对话使用的agent, 对话不存在时返回None"""
+        with self.read_lock:
+            row = self.read_conn.execute(
+                "SELECT agent FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def load_page(self, conversation_id, before_id=None, limit=None):
+        """按时间正序返回一页消息 [(id, role, sender, content)], before_id为已加载的最早消息id"""
+        limit = limit or self.page_size
+        with self.read_lock:
+            rows = self.read_conn.execute(
+                "SELECT id, role, sender, content FROM messages "
+                "WHERE conversation_id = ? AND id < ? ORDER BY id DESC LIMIT ?",
+                (conversation_id, before_id if before_id is not None else 2**63 - 1, limit)
+            ).fetchall()
+        rows.reverse()
+        return rows
+
+    def load_from(self, conversation_id, message_id, before=None, after=None):
+        """加载某条消息附近的一页: 之前before条到之后after条, 用于跳转到搜索结果"""
+        before = self.page_size // 2 if before is None else before
+        after = self.page_size if after is None else after
+        with self.read_lock:
+            start = self.read_conn.execute(
+                "SELECT MIN(id) FROM (SELECT id FROM messages WHERE conversation_id = ? AND id <= ? "
+                "ORDER BY id DESC LIMIT ?)",
+                (conversation_id, message_id, before + 1)
+            ).fetchone()[0]
+            if start is None:
+                return []
+            return self.read_conn.execute(
+                "SELECT id, role, sender, content FROM messages "
+                "WHERE conversation_id = ? AND id >= ? ORDER BY id LIMIT ?",
+                (conversation_id, start, before + 1 + after)
+            ).fetchall()
+
+    def search(self, query, limit=50):
+        """全文搜索所有对话, 按相关度返回 [(message_id, conversation_id, agent, role, content, created)]"""
+        match = build_match_query(query)
+        if not match:
+            return []
+        with self.read_lock:
+            try:
+                return self.read_conn.execute(
+                    "SELECT m.id, m.conversation_id, c.agent, m.role, m.content, m.created "
+                    "FROM messages_fts f "
+                    "JOIN messages m ON m.id = f.rowid "
+                    "JOIN conversations c ON c.id = m.conversation_id "
+                    "WHERE messages_fts MATCH ? ORDER BY bm25(messages_fts) LIMIT ?",
+                    (match, limit)
+                ).fetchall()
+            except sqlite3.OperationalError as e:
+                self.logger.warning(f"搜索语句无效 {match}: {str(e)}")
+                return []
+
+    def flush(self, timeout=None):
+        """等待已投递的写操作全部提交"""
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        """提交剩余的写操作并停止写线程"""
+        self.queue.put(None)
+        self.writer.join(timeout=5)
+        with self.read_lock:
+            self.read_conn.close()
@@ -0,0 +1,80 @@
+from .logger_manager import LoggerManager
+from .metrics import RequestMetrics
+
+SUMMARY_PROMPT = (
+    "你负责压缩一段对话的历史。请把新增的对话内容合并进已有摘要, "
+    "保留事实、结论、用户的要求和偏好以及尚未解决的问题, 省略寒暄和重复内容。"
+    "只输出更新后的摘要本身。"
+)
+
+class HistoryCompactor:
+    """后台滚动摘要
+
+    agent配置了 compaction 且发送的上下文超过阈值时, 用指定的(便宜的)模型
+    把最旧的若干轮对话合并进已有摘要, 之后发送时用摘要代替这些消息。
+    每次只把新增的轮次交给模型, 摘要增量扩展而不是从头重新生成;
+    摘要请求走响应缓存, 内容相同的请求(例如恢复同一对话后)直接命中缓存。
+
+    agent中的配置示例:
+        "compaction": {"enabled": true, "threshold_tokens": 4000,
+                       "model": "openai/gpt-4o-mini", "keep_last": 6}
+    """
+
+    def __init__(self, chat_client, config_manager, dispatch):
+        """dispatch 用于把结果交回调用方线程执行(GUI中为 wx.CallAfter)"""
+        self.logger = LoggerManager.get_logger()
+        self.chat_client = chat_client
+        self.config_manager = config_manager
+        self.dispatch = dispatch
+        # 正在摘要的历史, 同一个历史同时只运行一个摘要任务
+        self.running = set()
+
+    def maybe_compact(self, window, agent):
+        """发送的上下文超过阈值时在后台生成摘要, 返回Future, 无需摘要时返回None"""
+        compaction = agent.get('compaction') or {}
+        if not compaction.get('enabled') or id(window) in self.running:
+            return None
+        if window.context_tokens() <= compaction.get('threshold_tokens', 4000):
+            return None
+        upto, turns = window.pending_summary(max(1, compaction.get('keep_last', 6)))
+        if not turns:
+            return None
+
+        model = compaction.get('model', agent['model'])
+        transcript = "\n\n".join(f"{'用户' if role == 'user' else '助手'}: {content}" for role, content in turns)
+        messages = [
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": f"已有摘要:\n{window.summary or '(无)'}\n\n新增对话:\n{transcript}"}
+        ]
+        generation = window.generation
+        metrics = RequestMetrics("compaction", model)
+        self.running.add(id(window))
+        self.logger.info(f"开始压缩历史: {len(turns)}条消息, 上下文约{window.context_tokens()} tokens")
+
+        def on_complete(future):
+            # 失败由metrics记录, 摘要本身也可能以"错误"开头
+            try:
+                summary, error = future.result(), metrics.error
+            except Exception as e:
+                summary, error = "", e
+            self.dispatch(self._apply, window, generation, upto, summary, error)
+
+        future = self.chat_client.submit(
+            messages, model, lambda delta: None,
+            use_cache=agent.get('cache', False),
+            clients=self.config_manager.get_async_clients(agent),
+            metrics=metrics
+        )
+        future.add_done_callback(on_complete)
+        return future
+
+    def _apply(self, window, generation, upto, summary, error=None):
+        """在调用方线程中写入摘要, 期间历史被重置过则丢弃"""
+        self.running.discard(id(window))
+        if error is not None or not summary or not summary.strip():
+            self.logger.warning(f"压缩历史失败, 继续发送完整历史: {error or '摘要为空'}")
+            return
+        if window.generation != generation:
+            return
+        window.set_summary(summary.strip(), upto)
+        self.logger.info(f"历史压缩完成, 上下文约{window.context_tokens()} tokens")
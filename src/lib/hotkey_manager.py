@@ -1,5 +1,4 @@
 from .logger_manager import LoggerManager
-from global_hotkeys import *
 
 class HotkeyManager:
     def __init__(self, config, callback):
@@ -42,13 +41,16 @@ class HotkeyManager:
     
     def setup_global_hotkey(self):
         """设置全局热键"""
+        hotkey_str = self.config['hotkeys']['show_window']
         try:
+            # 第一次注册时才导入global_hotkeys, 不占用启动时间
+            from global_hotkeys import register_hotkeys, start_checking_hotkeys, stop_checking_hotkeys
+            
             # 如果已在运行，先停止
             if self.is_running:
                 stop_checking_hotkeys()
                 self.is_running = False
             
-            hotkey_str = self.config['hotkeys']['show_window']
             hotkey_str = self._convert_hotkey(hotkey_str)
             bindings =  [
                     [hotkey_str, None, lambda: self.callback(), True],
@@ -67,5 +69,6 @@ class HotkeyManager:
     def __del__(self):
         """清理资源"""
         if self.is_running:
+            from global_hotkeys import stop_checking_hotkeys
             stop_checking_hotkeys()
             self.is_running = False
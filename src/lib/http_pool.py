@@ -0,0 +1,74 @@
+import threading
+import time
+import httpx
+from .logger_manager import LoggerManager
+
+# HTTP/2需要可选依赖h2 (pip install httpx[http2])
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+class HttpPool:
+    """按endpoint共享的HTTP连接池
+
+    同一个base_url只创建一个httpx客户端, 配置变化时复用已有连接。
+    prewarm 提前完成 DNS + TCP + TLS 握手, 让第一条消息不必承担建连开销。
+    """
+
+    def __init__(self, max_connections=20, max_keepalive_connections=10,
+                 keepalive_expiry=60, http2=True):
+        self.logger = LoggerManager.get_logger()
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.clients = {}
+        self.async_clients = {}
+        self.last_prewarm = {}
+        self.lock = threading.Lock()
+
+    def get_client(self, base_url):
+        """获取同步客户端"""
+        with self.lock:
+            if base_url not in self.clients:
+                self.clients[base_url] = httpx.Client(limits=self.limits, http2=self.http2)
+            return self.clients[base_url]
+
+    def get_async_client(self, base_url):
+        """获取异步客户端(只能在同一个事件循环中使用)"""
+        with self.lock:
+            if base_url not in self.async_clients:
+                self.async_clients[base_url] = httpx.AsyncClient(limits=self.limits, http2=self.http2)
+            return self.async_clients[base_url]
+
+    def release_async_client(self, base_url):
+        """移除某个endpoint的异步客户端并返回, 由调用方在所属的事件循环中关闭"""
+        with self.lock:
+            self.last_prewarm.pop(base_url, None)
+            return self.async_clients.pop(base_url, None)
+
+    async def prewarm(self, base_url):
+        """预热连接, 在保活期内重复调用不会发起新请求"""
+        now = time.monotonic()
+        if now - self.last_prewarm.get(base_url, 0) < self.keepalive_expiry / 2:
+            return
+        self.last_prewarm[base_url] = now
+        try:
+            # 响应状态无关紧要, 只需要建立并保留连接
+            await self.get_async_client(base_url).head(base_url, timeout=10)
+            self.logger.debug(f"连接预热完成: {base_url}")
+        except httpx.HTTPError as e:
+            self.last_prewarm.pop(base_url, None)
+            self.logger.debug(f"连接预热失败 {base_url}: {str(e)}")
+
+    def close(self):
+        """关闭同步客户端; 异步客户端随事件循环一起结束"""
+        with self.lock:
+            for client in self.clients.values():
+                client.close()
+            self.clients.clear()
@@ -1,62 +1,213 @@
+import atexit
+import json
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+import threading
+import time
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 from datetime import datetime
 
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s'
+
+# 默认的高频事件规则, 可在配置 logging.throttle 中覆盖
+DEFAULT_THROTTLE = {
+    'stream_chunk': {'sample_every': 50, 'max_per_second': 20},
+    'rate_limit_queue': {'max_per_second': 5},
+}
+
+class RequestContextFilter(logging.Filter):
+    """在调用方线程中为日志记录附加当前请求的id、agent和模型"""
+
+    def filter(self, record):
+        # metrics模块依赖本模块, 在第一次记录日志时再导入
+        from .metrics import current_request
+        metrics = current_request.get()
+        record.request_id = getattr(metrics, 'request_id', None)
+        record.agent = getattr(metrics, 'agent', None)
+        record.model = getattr(metrics, 'model', None)
+        return True
+
+class ThrottleFilter(logging.Filter):
+    """对高频事件采样和限速
+
+    记录日志时用 extra={'event': '名字'} 标记事件, 规则按事件名配置:
+        {"stream_chunk": {"sample_every": 20, "max_per_second": 10}}
+    sample_every 为每N条保留1条, max_per_second 为每秒最多保留的条数。
+    没有标记或没有规则的记录不受影响。被丢弃的条数记在下一条保留的记录上。
+    """
+
+    def __init__(self, rules=None):
+        super().__init__()
+        self.rules = rules or {}
+        self.lock = threading.Lock()
+        # 事件名 -> [计数, 令牌数, 上次补充时间, 已丢弃条数]
+        self.state = {}
+
+    def filter(self, record):
+        event = getattr(record, 'event', None)
+        rule = self.rules.get(event) if event else None
+        if rule is None:
+            return True
+        now = time.monotonic()
+        with self.lock:
+            state = self.state.get(event)
+            if state is None:
+                rate = rule.get('max_per_second')
+                state = self.state[event] = [0, rate or 0, now, 0]
+            state[0] += 1
+            keep = state[0] % max(1, rule.get('sample_every', 1)) == 0
+            rate = rule.get('max_per_second')
+            if keep and rate:
+                state[1] = min(rate, state[1] + (now - state[2]) * rate)
+                state[2] = now
+                if state[1] >= 1:
+                    state[1] -= 1
+                else:
+                    keep = False
+            if not keep:
+                state[3] += 1
+                return False
+            record.suppressed, state[3] = state[3], 0
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """每条记录一行JSON, 附带请求id等上下文字段"""
+
+    FIELDS = ('request_id', 'agent', 'model', 'event', 'suppressed')
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'location': f"{record.filename}:{record.lineno}",
+            'message': record.getMessage(),
+        }
+        for field in self.FIELDS:
+            value = getattr(record, field, None)
+            if value:
+                entry[field] = value
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        elif record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class TextFormatter(logging.Formatter):
+    """原有的文本格式, 有省略的记录时在末尾注明"""
+
+    def format(self, record):
+        text = super().format(record)
+        suppressed = getattr(record, 'suppressed', 0)
+        return f"{text} (此前省略{suppressed}条)" if suppressed else text
+
 class LoggerManager:
+    """日志单例
+
+    记录日志的线程(包括GUI线程)只做过滤并把记录放入队列, 格式化和文件写入
+    由后台的 QueueListener 线程完成。configure 按配置的 logging 段切换
+    文本/JSON Lines格式、调整级别和高频事件的采样规则。
+    """
+
     _instance = None
     _initialized = False
-    
+
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(LoggerManager, cls).__new__(cls)
         return cls._instance
-    
+
     def __init__(self):
         if LoggerManager._initialized:
             return
-            
+
         LoggerManager._initialized = True
         self.logger = logging.getLogger('ChatApp')
         self.logger.setLevel(logging.DEBUG)
-        
+
         # 创建logs目录
         logs_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs')
         if not os.path.exists(logs_dir):
             os.makedirs(logs_dir)
-            
+
         # 日志文件路径
         log_file = os.path.join(logs_dir, f'chat_app_{datetime.now().strftime("%Y%m%d")}.log')
-        
+
         # 创建文件处理器(最大10MB,保留5个备份)
-        file_handler = RotatingFileHandler(
+        self.file_handler = RotatingFileHandler(
             log_file,
             maxBytes=10*1024*1024,  # 10MB
             backupCount=5,
             encoding='utf-8'
         )
-        file_handler.setLevel(logging.DEBUG)
-        
+        self.file_handler.setLevel(logging.DEBUG)
+
         # 创建控制台处理器
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(logging.INFO)
-        
+        self.console_handler = logging.StreamHandler()
+        self.console_handler.setLevel(logging.INFO)
+
         # 设置日志格式
-        formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s'
-        )
-        file_handler.setFormatter(formatter)
-        console_handler.setFormatter(formatter)
-        
+        formatter = TextFormatter(TEXT_FORMAT)
+        self.file_handler.setFormatter(formatter)
+        self.console_handler.setFormatter(formatter)
+
+        # 调用方线程只把记录放入队列, 由监听线程交给文件和控制台处理器
+        self.throttle = ThrottleFilter(dict(DEFAULT_THROTTLE))
+        self.queue_handler = _RecordQueueHandler(queue.SimpleQueue())
+        self.queue_handler.addFilter(self.throttle)
+        self.queue_handler.addFilter(RequestContextFilter())
+        self.listener = QueueListener(self.queue_handler.queue, self.file_handler, self.console_handler,
+                                      respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.shutdown)
+
         # 添加处理器
-        self.logger.addHandler(file_handler)
-        self.logger.addHandler(console_handler)
-    
+        self.logger.addHandler(self.queue_handler)
+
+    def configure(self, config):
+        """按配置的 logging 段调整日志, 例如:
+            {"format": "json", "file_level": "DEBUG", "console_level": "INFO",
+             "throttle": {"stream_chunk": {"sample_every": 20, "max_per_second": 10}}}
+        """
+        config = config or {}
+        if config.get('format') == 'json':
+            self.file_handler.setFormatter(JsonFormatter())
+        else:
+            self.file_handler.setFormatter(TextFormatter(TEXT_FORMAT))
+        self.file_handler.setLevel(config.get('file_level', 'DEBUG'))
+        self.console_handler.setLevel(config.get('console_level', 'INFO'))
+        self.throttle.rules = dict(DEFAULT_THROTTLE, **config.get('throttle', {}))
+
+    def shutdown(self):
+        """处理完队列中剩余的记录后停止监听线程"""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
     @staticmethod
     def get_logger():
         """获取logger实例"""
         return LoggerManager().logger
 
+class _RecordQueueHandler(QueueHandler):
+    """放入队列前只合并消息参数, 不在调用方线程中格式化整行
+
+    标准 QueueHandler.prepare 会用格式化后的整行替换消息, 文件和控制台处理器
+    就无法再使用各自的格式(例如JSON)。
+    """
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # 异常对象不跨线程传递, 先转换为文本
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
 # 使用示例:
 # from logger_manager import LoggerManager
 # logger = LoggerManager.get_logger()
@@ -64,3 +215,4 @@ class LoggerManager:
 # logger.info('普通信息')
 # logger.warning('警告信息')
 # logger.error('错误信息')
+# logger.debug('收到增量', extra={'event': 'stream_chunk'})  # 高频事件按 logging.throttle 采样
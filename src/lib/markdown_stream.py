@@ -0,0 +1,142 @@
+import re
+
+HEADING = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+FENCE = re.compile(r'^\s*(`{3,}|~{3,})\s*([\w+-]*)')
+RULE = re.compile(r'^\s*([-*_])(\s*\1){2,}\s*$')
+LIST_ITEM = re.compile(r'^(\s*)([-*+]|\d+[.)])\s+(.*)$')
+QUOTE = re.compile(r'^\s*>\s?(.*)$')
+INLINE = re.compile(
+    r'`([^`]+)`'                        # 行内代码
+    r'|\*\*(.+?)\*\*|__(.+?)__'         # 粗体
+    r'|\*(?=\S)(.+?)(?<=\S)\*'          # 斜体
+    r'|\[([^\]]+)\]\(([^)\s]+)\)'       # 链接
+)
+
+# 列表最多缩进的层级
+MAX_LIST_LEVEL = 3
+# 影响整行排版(字号或左缩进)的样式, 测量换行时按行区分
+BLOCK_STYLES = (('h1', 'h2', 'h3', 'quote', 'code_block')
+                + tuple(f'list{level}' for level in range(1, MAX_LIST_LEVEL + 1)))
+
+def block_style(spans):
+    """一行渲染结果的块级样式(从行首开始的第一个样式区间), 普通行返回None"""
+    if spans and spans[0][0] == 0 and spans[0][2] in BLOCK_STYLES:
+        return spans[0][2]
+    return None
+
+class StreamingMarkdown:
+    """流式Markdown解析器
+
+    解析状态(是否在代码块中)在多次增量之间保持。每次 feed 只处理新完成的行
+    和仍未结束的最后一行: 完成的行渲染一次后不再改变, 未结束的行每次重新渲染,
+    因此单次增量的开销只与新增内容和最后一行的长度有关, 与整条消息的长度无关。
+
+    渲染结果为纯文本加样式区间 [(start, end, style)], 样式名由界面映射为字体和颜色。
+    标题、引用、列表和代码块都保留可朗读的文字(标题和引用提示、项目符号、代码块起止提示),
+    读屏软件不依赖字体样式也能分辨结构。
+    line_styles 和 tail_style 为各行的块级样式, 界面据此按字号和缩进测量换行。
+    """
+
+    def __init__(self):
+        self.line = ""       # 尚未结束的源码行
+        self.in_code = False
+        self.fence = None
+        self.line_styles = []  # 已完成的各行的块级样式
+        self.tail_style = None
+
+    def feed(self, delta):
+        """加入增量, 返回 (新完成的行的渲染结果, 未结束的行的渲染结果), 各为 (text, spans)"""
+        self.line += delta
+        text, spans = "", []
+        if '\n' in delta:
+            *complete, self.line = self.line.split('\n')
+            parts = []
+            offset = 0
+            for source in complete:
+                line_text, line_spans = self.render_line(source, final=True)
+                parts.append(line_text + '\n')
+                self.line_styles.append(block_style(line_spans))
+                spans.extend((start + offset, end + offset, style) for start, end, style in line_spans)
+                offset += len(line_text) + 1
+            text = "".join(parts)
+        tail = self.render_line(self.line, final=False) if self.line else ("", [])
+        self.tail_style = block_style(tail[1])
+        return (text, spans), tail
+
+    def render_line(self, source, final):
+        """渲染一行源码; final为False时是未结束的行, 不改变解析状态"""
+        if self.in_code:
+            if source.strip().startswith(self.fence):
+                if final:
+                    self.in_code = False
+                    self.fence = None
+                return self._marker("[代码结束]")
+            return source, [(0, len(source), 'code_block')] if source else []
+
+        match = FENCE.match(source)
+        if match:
+            if final:
+                self.in_code = True
+                self.fence = match.group(1)
+            language = match.group(2)
+            return self._marker(f"[代码: {language}]" if language else "[代码]")
+
+        match = HEADING.match(source)
+        if match:
+            level = len(match.group(1))
+            return self._prefixed(f"[标题{level}] ", match.group(2), f'h{min(level, 3)}')
+
+        if RULE.match(source):
+            return self._marker("―" * 20)
+
+        match = LIST_ITEM.match(source)
+        if match:
+            indent, bullet, content = match.groups()
+            level = min(len(indent.expandtabs(4)) // 2, MAX_LIST_LEVEL - 1) + 1
+            prefix = "• " if bullet in "-*+" else f"{bullet} "
+            return self._prefixed(prefix, content, f'list{level}')
+
+        match = QUOTE.match(source)
+        if match:
+            return self._prefixed("[引用] ", match.group(1), 'quote')
+
+        return self.render_inline(source)
+
+    @staticmethod
+    def _marker(text):
+        return text, [(0, len(text), 'marker')]
+
+    def _prefixed(self, prefix, content, style):
+        """整行使用块级样式, 行首加上可朗读的提示(以灰色标记显示)"""
+        text, spans = self.render_inline(content)
+        text = prefix + text
+        spans = [(start + len(prefix), end + len(prefix), inline) for start, end, inline in spans]
+        return text, [(0, len(text), style), (0, len(prefix) - 1, 'marker')] + spans
+
+    @staticmethod
+    def render_inline(source):
+        """渲染行内的代码、粗体、斜体和链接, 去掉标记符号"""
+        parts = []
+        spans = []
+        length = 0
+        position = 0
+        for match in INLINE.finditer(source):
+            plain = source[position:match.start()]
+            parts.append(plain)
+            length += len(plain)
+            code, bold, bold2, italic, link_text, link_url = match.groups()
+            if code is not None:
+                content, style = code, 'code'
+            elif bold is not None or bold2 is not None:
+                content, style = bold if bold is not None else bold2, 'bold'
+            elif italic is not None:
+                content, style = italic, 'italic'
+            else:
+                # 链接保留地址, 文本框会自动识别URL
+                content, style = f"{link_text} ({link_url})", 'link'
+            parts.append(content)
+            spans.append((length, length + len(content), style))
+            length += len(content)
+            position = match.end()
+        parts.append(source[position:])
+        return "".join(parts), spans
@@ -1,27 +1,291 @@
+import bisect
 import wx
-import wx.lib.scrolledpanel as scrolled
+from .markdown_stream import StreamingMarkdown
+
+# 可见区域上下额外绑定控件的像素范围, 小幅滚动时不需要重新绑定
+OVERSCAN = 600
+# 滚动单位(像素)
+SCROLL_RATE = 20
+# 消息行外边距, 以及发送者标签和文本框各自的边距
+ROW_MARGIN = 5
+# 文本框内部为文字预留的边距
+TEXT_PADDING = 10
+# 列表、引用和代码块每级缩进(单位为十分之一毫米)
+INDENT = 40
+# 标题相对正文的字号
+HEADING_SCALES = {'h1': 1.4, 'h2': 1.2, 'h3': 1.0}
+# Windows的文本框位置按UTF-16编码单元计数, BMP以外的字符(如emoji)占两个位置
+UTF16_POSITIONS = wx.Platform == '__WXMSW__'
+
+def native_length(text):
+    """文本在原生文本框中占的位置数"""
+    if not UTF16_POSITIONS or text.isascii():
+        return len(text)
+    return len(text) + sum(1 for ch in text if ord(ch) > 0xFFFF)
+
+def native_spans(text, spans):
+    """把按字符计的样式区间转换为文本框中的位置"""
+    if not UTF16_POSITIONS or text.isascii():
+        return spans
+    wide = [i for i, ch in enumerate(text) if ord(ch) > 0xFFFF]
+    if not wide:
+        return spans
+    return [(start + bisect.bisect_left(wide, start), end + bisect.bisect_left(wide, end), style)
+            for start, end, style in spans]
+
+class WrapMeasure:
+    """单条消息的增量换行测量
+
+    已经结束(以换行符结尾)的行测量一次后只累加高度, 之后每次只测量新增的
+    完整行和未结束的最后一行, 不读取整条消息的文本。
+    key 为 (换行宽度, 字体), 变化时缓存失效。
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, key=None):
+        self.key = key
+        self.parts = 0    # 已处理的文本片段数
+        self.lines = 0    # 已完成的行数
+        self.carry = ""   # 已处理的片段中尚未结束的行
+        self.height = 0   # 已完成的行的总高度
+
+    def measure(self, panel, dc, item, key):
+        """返回消息换行后的高度, 只测量上次之后新增的行"""
+        if key != self.key:
+            self.reset(key)
+        for part in item.parts[self.parts:]:
+            *complete, self.carry = (self.carry + part).split('\n')
+            for line in complete:
+                self.height += panel.measure_line(dc, line, item.line_style(self.lines))
+                self.lines += 1
+        self.parts = len(item.parts)
+        return self.height + panel.measure_line(dc, self.carry + item.tail, item.tail_style)
+
+
+class MessageItem:
+    """一条消息的数据
+
+    只有在可见区域附近时才绑定原生控件(MessageRow), 其余时间只保存文本和高度。
+    保留 GetValue / SetFocus, 调用方可以像使用文本框一样使用它。
+    AI的消息按Markdown渲染, text为渲染后的文本, spans为样式区间;
+    未结束的最后一行从 tail_start 开始, 每次增量只替换这一部分。
+    spans 和 tail_start 为原生文本框中的位置(见 native_length)。
+    文本按片段保存, 增量只追加片段, 读取 text 时才拼接, 流式输出时不需要整条消息的文本。
+    """
+
+    def __init__(self, panel, sender, text=""):
+        self.panel = panel
+        self.sender = sender
+        self.spans = []
+        self.index = 0
+        self.height = 0
+        self.exact = False  # 高度是否已按当前宽度精确测量, 否则为估算值
+        self.wrap = WrapMeasure()
+        self.row = None
+        self.markdown = None
+        self.text = ""
+        if sender.startswith("AI"):
+            self.markdown = StreamingMarkdown()
+            self.tail_start = 0
+            self.tail_span_index = 0
+            if text:
+                self.feed_markdown(text)
+        elif text:
+            self.append(text)
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = "".join(self.parts) + self.tail
+        return self._text
+
+    @text.setter
+    def text(self, value):
+        self.parts = []      # 已完成的文本片段
+        self.tail = ""       # 未结束的最后一行, 每次增量整体替换
+        self._text = None    # 拼接结果的缓存, 文本变化后清空
+        self.length = 0      # 片段的总字符数和换行数, 用于估算高度
+        self.newlines = 0
+        if value:
+            self.append(value)
+
+    @property
+    def tail_style(self):
+        return self.markdown.tail_style if self.markdown is not None else None
+
+    def line_style(self, line):
+        """第line个已完成的行的块级样式, 普通文本为None"""
+        return self.markdown.line_styles[line] if self.markdown is not None else None
+
+    def append(self, delta):
+        """追加文本, 不复制已有内容"""
+        self.parts.append(delta)
+        self.length += len(delta)
+        self.newlines += delta.count('\n')
+        self._text = None
+
+    def feed_markdown(self, delta):
+        """把增量交给Markdown解析器并替换未结束的行, 返回 (替换起点, 新文本, 新样式区间)"""
+        (done, done_spans), (tail, tail_spans) = self.markdown.feed(delta)
+        start = self.tail_start
+        del self.spans[self.tail_span_index:]
+        new_spans = [(begin + start, end + start, style) for begin, end, style in native_spans(done, done_spans)]
+        self.spans.extend(new_spans)
+        self.tail_span_index = len(self.spans)
+        self.tail_start = start + native_length(done)
+        tail_spans = [(begin + self.tail_start, end + self.tail_start, style)
+                      for begin, end, style in native_spans(tail, tail_spans)]
+        self.spans.extend(tail_spans)
+        if done:
+            self.append(done)
+        self.tail = tail
+        self._text = None
+        return start, done + tail, new_spans + tail_spans
+
+    def GetValue(self):
+        return self.text
+
+    def SetFocus(self):
+        self.panel.focus_message(self)
+
+
+class MessageRow:
+    """一组可复用的原生控件: 面板、发送者标签和只读文本框"""
+
+    def __init__(self, panel):
+        self.owner = panel
+        self.item = None
+        self.panel = wx.Panel(panel)
+        sizer = wx.BoxSizer(wx.VERTICAL)
+
+        self.sender_text = wx.StaticText(self.panel, -1, "")
+
+        # 创建消息文本框
+        self.message_text = wx.TextCtrl(self.panel, -1, "",
+                                        style=wx.TE_READONLY | wx.TE_AUTO_URL | wx.NO_BORDER | wx.TE_RICH2 |
+                                              wx.TE_BESTWRAP | wx.TE_MULTILINE | wx.TE_NO_VSCROLL)
+
+        # 绑定消息文本框的滚轮和按键事件
+        self.message_text.Bind(wx.EVT_MOUSEWHEEL, panel.OnMouseWheel)
+        self.message_text.Bind(wx.EVT_KEY_DOWN, self.OnKeyDown)
+
+        sizer.Add(self.sender_text, 0, wx.ALL, ROW_MARGIN)
+        sizer.Add(self.message_text, 0, wx.EXPAND | wx.ALL, ROW_MARGIN)
+        self.panel.SetSizer(sizer)
+
+    def bind(self, item):
+        """把控件绑定到一条消息"""
+        self.item = item
+        item.row = self
+        self.sender_text.SetLabel(f"{item.sender}:")
+        self.sender_text.SetForegroundColour(wx.BLUE if item.sender.startswith("AI") else wx.BLACK)
+        self.message_text.SetDefaultStyle(self.owner.text_style('normal'))
+        self.message_text.ChangeValue(item.text)
+        self.apply_spans(item.spans)
+        self.panel.Show()
+
+    def apply_spans(self, spans):
+        for start, end, style in spans:
+            self.message_text.SetStyle(start, end, self.owner.text_style(style))
+
+    def replace_from(self, start, text, spans):
+        """替换从start到末尾的文本(未结束的行)并应用新的样式"""
+        self.message_text.Remove(start, self.message_text.GetLastPosition())
+        self.message_text.SetDefaultStyle(self.owner.text_style('normal'))
+        self.message_text.AppendText(text)
+        self.apply_spans(spans)
+
+    def unbind(self):
+        if self.item is not None:
+            self.item.row = None
+        self.item = None
+        self.panel.Hide()
+
+    def place(self, y, width, text_height):
+        """按消息的位置和高度摆放控件(y为虚拟坐标)"""
+        x, y = self.owner.CalcScrolledPosition(0, y)
+        self.message_text.SetMinSize((width - 2 * ROW_MARGIN, text_height + TEXT_PADDING))
+        self.panel.SetSize(x + ROW_MARGIN, y + ROW_MARGIN, width, self.item.height - 2 * ROW_MARGIN)
+        self.panel.Layout()
+        # 读屏软件通过名称播报消息的位置
+        self.message_text.SetName(f"{self.item.sender} 第{self.item.index + 1}条, 共{len(self.owner.items)}条")
+
+    def OnKeyDown(self, event):
+        """Ctrl+上/下 在消息之间移动焦点"""
+        key = event.GetKeyCode()
+        if event.ControlDown() and key in (wx.WXK_UP, wx.WXK_DOWN) and self.item is not None:
+            self.owner.focus_neighbour(self.item, -1 if key == wx.WXK_UP else 1)
+        else:
+            event.Skip()
+
+
+class MessagePanel(wx.ScrolledWindow):
+    """虚拟化的消息历史
+
+    所有消息只以 MessageItem 的形式保存文本和高度, 原生控件只为可见区域
+    附近的消息创建, 滚出范围的控件被回收复用。tops 为各消息顶部位置的前缀和,
+    可见范围用二分查找确定, 因此布局和滚动的开销与消息总数无关。
+    不在可见范围的消息使用估算高度, 进入可见范围时再精确测量。
+    键盘焦点所在的消息始终保留控件, Ctrl+上/下 可以逐条浏览。
+
+    文本和消息的变化只记录脏标记(最早需要重排的位置、需要测量的消息、
+    是否需要滚动到底部), 由 wx.CallAfter 在本轮事件处理结束后合并执行,
+    渲染节拍一帧内的所有更新只做一次布局和一次滚动。
+    用户向上滚动阅读时不再自动滚动到底部, 回到底部后恢复。
+    """
 
-class MessagePanel(scrolled.ScrolledPanel):
     def __init__(self, parent):
         super().__init__(parent, style=wx.SUNKEN_BORDER | wx.VSCROLL | wx.WANTS_CHARS)
-        self.history_sizer = wx.BoxSizer(wx.VERTICAL)
-        self.SetSizer(self.history_sizer)
-        
+        self.SetName("消息历史")
+
         # 设置滚动
-        self.SetupScrolling(scroll_x=True, scroll_y=True, rate_y=20)
-        
-        # 记录最新的消息文本框
+        self.SetScrollRate(0, SCROLL_RATE)
+
+        self.items = []
+        self.tops = [0]
+        self.rows = []
+        self.spare_rows = []
+        self.client_width = 0
+        self.line_height = 0
+        self.char_width = 0
+        self.measure_dc = None
+        self.font_key = None
+        self.text_styles = {}
+        self.heading_fonts = {}
+        self.indent_width = 0  # INDENT 对应的像素宽度
+
+        # 记录最新的消息
         self.latest_message_text = None
-        
+
+        # 布局脏标记: 最早需要重排的消息、需要重新测量的消息、是否请求滚动到底部
+        self.dirty_from = None
+        self.dirty_items = set()
+        self.scroll_requested = False
+        self.layout_scheduled = False
+        # 视图停留在底部时新内容自动滚动; 用户向上滚动后暂停
+        self.follow_bottom = True
+
+        # 滚动到顶部时的回调, 用于加载更早的消息
+        self.on_reach_top = None
+
         # 绑定鼠标滚轮事件处理函数
         self.Bind(wx.EVT_MOUSEWHEEL, self.OnMouseWheel)
-        
+        self.Bind(wx.EVT_SCROLLWIN, self.OnScroll)
+        self.Bind(wx.EVT_SIZE, self.OnSize)
+
+    @property
+    def wrap_width(self):
+        """文本换行宽度"""
+        return max(self.client_width - 4 * ROW_MARGIN - 2 * TEXT_PADDING, 50)
+
     def OnMouseWheel(self, event):
         """处理鼠标滚轮事件"""
         # 获取滚轮旋转方向和位置
         rotation = event.GetWheelRotation()
         position = event.GetPosition()
-        
+
         # 检查鼠标是否在窗口内或当前焦点在消息文本框上
         window_rect = self.GetRect()
         focused_window = wx.Window.FindFocus()
@@ -29,123 +293,402 @@ class MessagePanel(scrolled.ScrolledPanel):
             # 计算新的滚动位置
             current_position = self.GetViewStart()[1]
             new_position = current_position - rotation / event.GetWheelDelta()
-            
+
             # 设置新的滚动位置
             self.Scroll(-1, int(new_position))
+            self.follow_bottom = self.is_at_bottom()
+            self.update_viewport()
+            if rotation > 0:
+                self.check_reach_top()
         else:
             # 如果鼠标不在窗口内,则跳过处理
             event.Skip()
-        
+
+    def OnScroll(self, event):
+        """拖动滚动条后更新可见范围, 并检查是否到达顶部"""
+        event.Skip()
+        wx.CallAfter(self.OnScrolled)
+
+    def OnScrolled(self):
+        self.follow_bottom = self.is_at_bottom()
+        self.update_viewport()
+        self.check_reach_top()
+
+    def is_at_bottom(self):
+        """视图是否停留在底部(允许一个滚动单位的误差)"""
+        view_bottom = self.GetViewStart()[1] * SCROLL_RATE + self.GetClientSize().height
+        return view_bottom >= self.tops[-1] - SCROLL_RATE
+
+    def OnSize(self, event):
+        """宽度变化时所有高度失效, 重新估算后只精确测量可见的消息"""
+        event.Skip()
+        width = self.GetClientSize().width
+        if width != self.client_width:
+            self.client_width = width
+            for item in self.items:
+                item.exact = False
+        # 高度变化也可能改变底部位置, 跟随底部时保持在底部
+        self.invalidate(0, scroll=self.follow_bottom)
+
+    def check_reach_top(self):
+        if self.on_reach_top and self.GetViewStart()[1] == 0:
+            self.on_reach_top()
+
+    def _measure_dc(self):
+        """返回复用的测量DC, 字体变化时更新行高和估算用的平均字宽
+
+        字体变化后所有消息的测量结果失效, 重新估算高度。
+        """
+        font = self.GetFont()
+        font_key = font.GetNativeFontInfoDesc()
+        if self.measure_dc is None:
+            self.measure_dc = wx.MemoryDC(wx.Bitmap(1, 1))
+        if font_key != self.font_key:
+            dc = self.measure_dc
+            dc.SetFont(font)
+            self.line_height = dc.GetCharHeight()
+            self.char_width = (dc.GetCharWidth() + dc.GetTextExtent("中")[0]) / 2
+            self.indent_width = round(INDENT * dc.GetPPI()[0] / 254)
+            first_time = self.font_key is None
+            self.font_key = font_key
+            self.text_styles = {}
+            self.heading_fonts = {}
+            if not first_time:
+                for item in self.items:
+                    item.exact = False
+                self.relayout(0)
+        return self.measure_dc
+
+    def text_style(self, name):
+        """Markdown样式名对应的文本样式, 按当前字体创建并缓存"""
+        style = self.text_styles.get(name)
+        if style is not None:
+            return style
+        font = self.GetFont()
+        style = wx.TextAttr()
+        if name == 'normal':
+            style.SetFont(font)
+            style.SetTextColour(wx.SystemSettings.GetColour(wx.SYS_COLOUR_WINDOWTEXT))
+            style.SetLeftIndent(0, 0)
+        elif name in HEADING_SCALES:
+            style.SetFontPointSize(round(font.GetPointSize() * HEADING_SCALES[name]))
+            style.SetFontWeight(wx.FONTWEIGHT_BOLD)
+        elif name == 'bold':
+            style.SetFontWeight(wx.FONTWEIGHT_BOLD)
+        elif name == 'italic':
+            style.SetFontStyle(wx.FONTSTYLE_ITALIC)
+        elif name in ('code', 'code_block'):
+            style.SetFontFamily(wx.FONTFAMILY_TELETYPE)
+            style.SetBackgroundColour(wx.Colour(240, 240, 240))
+            if name == 'code_block':
+                style.SetLeftIndent(INDENT, 0)
+        elif name == 'link':
+            style.SetTextColour(wx.BLUE)
+            style.SetFontUnderlined(True)
+        elif name == 'quote':
+            style.SetTextColour(wx.Colour(96, 96, 96))
+            style.SetLeftIndent(INDENT, 0)
+        elif name == 'marker':
+            style.SetTextColour(wx.Colour(128, 128, 128))
+        elif name.startswith('list'):
+            # 悬挂缩进: 项目符号突出, 换行后的文字与第一行文字对齐
+            style.SetLeftIndent(INDENT * int(name[4:]), INDENT // 2)
+        self.text_styles[name] = style
+        return style
+
+    def heading_font(self, name):
+        """测量标题用的字体, 与 text_style 中标题的字号和粗细一致"""
+        font = self.heading_fonts.get(name)
+        if font is None:
+            font = wx.Font(self.GetFont())
+            font.SetPointSize(round(font.GetPointSize() * HEADING_SCALES[name]))
+            font.SetWeight(wx.FONTWEIGHT_BOLD)
+            self.heading_fonts[name] = font
+        return font
+
+    def line_indent(self, style):
+        """块级样式的左缩进(像素), 列表取悬挂缩进后换行部分的缩进"""
+        if style is None:
+            return 0
+        if style.startswith('list'):
+            return self.indent_width * int(style[4:]) + self.indent_width // 2
+        if style in ('quote', 'code_block'):
+            return self.indent_width
+        return 0
+
+    def measure_line(self, dc, text, style=None):
+        """一行文字换行后的高度: 标题按标题字体测量, 缩进的行按扣除缩进后的宽度换行"""
+        width = max(self.wrap_width - self.line_indent(style), 1)
+        line_height = self.line_height
+        heading = style in HEADING_SCALES
+        if heading:
+            dc.SetFont(self.heading_font(style))
+            line_height = dc.GetCharHeight()
+        rows = 1
+        row_start = 0
+        previous = 0
+        for extent in dc.GetPartialTextExtents(text) if text else ():
+            # 放不下的字符换到下一行, 新的一行从它之前的位置开始
+            if extent - row_start > width:
+                rows += 1
+                row_start = previous
+            previous = extent
+        if heading:
+            dc.SetFont(self.GetFont())
+        return rows * line_height
+
+    def estimate_text_height(self, length, newlines):
+        """不创建控件、不逐字测量, 按字符数和换行数粗略估算高度"""
+        chars_per_line = max(1, int(self.wrap_width / max(self.char_width, 1)))
+        return (newlines + 1 + length // chars_per_line) * self.line_height
+
+    def _row_height(self, text_height):
+        """消息行的总高度: 外边距 + 发送者标签 + 文本框"""
+        return (2 * ROW_MARGIN + (self.line_height + 2 * ROW_MARGIN)
+                + (text_height + TEXT_PADDING + 2 * ROW_MARGIN))
+
+    def _text_height(self, item):
+        return item.height - self._row_height(0)
+
+    def _measure(self, item, dc):
+        """按 (宽度, 字体) 增量测量, 只有新增的文本需要测量"""
+        key = (self.wrap_width, self.font_key)
+        item.height = self._row_height(item.wrap.measure(self, dc, item, key))
+        item.exact = True
+
+    def relayout(self, start=0):
+        """从第start条开始重新计算位置, 之前的位置保持不变"""
+        if not self.line_height:
+            self._measure_dc()
+        del self.tops[start + 1:]
+        for item in self.items[start:]:
+            if not item.exact:
+                tail = item.tail
+                item.height = self._row_height(self.estimate_text_height(
+                    item.length + len(tail), item.newlines + tail.count('\n')))
+            self.tops.append(self.tops[-1] + item.height)
+        self.SetVirtualSize((self.client_width, self.tops[-1]))
+
+    def _visible_range(self):
+        top = self.GetViewStart()[1] * SCROLL_RATE
+        bottom = top + self.GetClientSize().height
+        first = max(bisect.bisect_right(self.tops, top - OVERSCAN) - 1, 0)
+        last = min(bisect.bisect_left(self.tops, bottom + OVERSCAN), len(self.items))
+        return first, last
+
+    def update_viewport(self):
+        """为可见范围内的消息绑定控件, 回收范围外的控件"""
+        if not self.items:
+            return
+        first, last = self._visible_range()
+
+        # 进入可见范围的消息按当前宽度精确测量, 修正估算高度
+        changed = None
+        dc = None
+        for item in self.items[first:last]:
+            if not item.exact:
+                dc = dc or self._measure_dc()
+                self._measure(item, dc)
+                changed = item.index if changed is None else changed
+        if changed is not None:
+            # 上方消息的高度被修正时, 保持第一条可见消息在屏幕上的位置不变
+            view_top = self.GetViewStart()[1] * SCROLL_RATE
+            anchor = max(bisect.bisect_right(self.tops, view_top) - 1, 0)
+            offset = view_top - self.tops[anchor]
+            self.relayout(changed)
+            if changed < anchor:
+                self.Scroll(-1, (self.tops[anchor] + offset) // SCROLL_RATE)
+            first, last = self._visible_range()
+
+        # 回收范围外的控件, 键盘焦点所在的消息除外
+        visible = set(range(first, last))
+        focused = wx.Window.FindFocus()
+        for row in list(self.rows):
+            if row.item.index not in visible and row.message_text is not focused:
+                row.unbind()
+                self.rows.remove(row)
+                self.spare_rows.append(row)
+
+        # 为范围内的消息绑定控件
+        width = self.client_width - 2 * ROW_MARGIN
+        for index in range(first, last):
+            item = self.items[index]
+            if item.row is None:
+                row = self.spare_rows.pop() if self.spare_rows else MessageRow(self)
+                row.bind(item)
+                self.rows.append(row)
+        for row in self.rows:
+            row.place(self.tops[row.item.index], width, self._text_height(row.item))
+
+    def refresh_layout(self):
+        """重新计算所有位置并刷新可见范围"""
+        self.client_width = self.GetClientSize().width
+        self.invalidate(0)
+        self.flush_layout()
+
+    def invalidate(self, index, item=None, scroll=False):
+        """标记从第index条开始需要重排(item为需要重新测量的消息), 合并到下一次布局"""
+        self.dirty_from = index if self.dirty_from is None else min(self.dirty_from, index)
+        if item is not None:
+            self.dirty_items.add(item)
+        if scroll:
+            self.scroll_requested = True
+        if not self.layout_scheduled:
+            self.layout_scheduled = True
+            wx.CallAfter(self.flush_layout)
+
+    def flush_layout(self):
+        """执行合并后的布局: 测量一次、重排一次、滚动一次、更新一次可见范围"""
+        self.layout_scheduled = False
+        if self.dirty_from is None and not self.scroll_requested:
+            return
+        if self.dirty_items:
+            dc = self._measure_dc()
+            for item in self.dirty_items:
+                if item.row is not None:
+                    self._measure(item, dc)
+                else:
+                    item.exact = False
+            self.dirty_items = set()
+        if self.dirty_from is not None:
+            self.relayout(min(self.dirty_from, len(self.items)))
+            self.dirty_from = None
+        if self.scroll_requested and self.follow_bottom:
+            max_scroll = max(0, self.tops[-1] - self.GetClientSize().height)
+            self.Scroll(-1, (max_scroll + SCROLL_RATE - 1) // SCROLL_RATE)
+        self.scroll_requested = False
+        self.update_viewport()
+
+    def _append_item(self, sender, text=""):
+        item = MessageItem(self, sender, text)
+        item.index = len(self.items)
+        self.items.append(item)
+        if item.index == 0 and not self.client_width:
+            self.client_width = self.GetClientSize().width
+        self.invalidate(item.index, scroll=True)
+        return item
+
     def create_message_panel(self, sender):
-        """创建消息面板"""
-        msg_panel = wx.Panel(self)
-        msg_sizer = wx.BoxSizer(wx.VERTICAL)
-        
-        sender_text = wx.StaticText(msg_panel, -1, f"{sender}:")
-        sender_text.SetForegroundColour(wx.BLUE if sender == "AI" else wx.BLACK)
-        
-        # 创建消息文本框
-        message_text = wx.TextCtrl(msg_panel, -1, "", 
-                                 style=wx.TE_READONLY | wx.TE_AUTO_URL | wx.NO_BORDER | 
-                                       wx.TE_BESTWRAP | wx.TE_MULTILINE | wx.TE_NO_VSCROLL)
-        
-        # 设置文本框的宽度为父窗口的宽度减去边距
-        message_text.SetMinSize((self.GetSize()[0] - 40, -1))
-        
-        # 绑定消息文本框的滚轮事件处理函数
-        message_text.Bind(wx.EVT_MOUSEWHEEL, self.OnMouseWheel)
-        
-        msg_sizer.Add(sender_text, 0, wx.ALL, 5)
-        msg_sizer.Add(message_text, 0, wx.EXPAND | wx.ALL, 5)
-        msg_panel.SetSizer(msg_sizer)
-        
-        self.history_sizer.Add(msg_panel, 0, wx.EXPAND | wx.ALL, 5)
-        self.Layout()
-        self.FitInside()
-        self.scroll_to_bottom()
-        
-        # 更新最新的消息文本框引用
-        self.latest_message_text = message_text
-        
-        return message_text
-        
-    def update_message_text_size(self, message_text, text):
-        """更新消息文本框大小"""
-        if not message_text:
+        """创建一条消息, 返回对应的 MessageItem"""
+        item = self._append_item(sender)
+
+        # 更新最新的消息引用
+        self.latest_message_text = item
+
+        return item
+
+    def update_message_text_size(self, message_text, text, scroll=True):
+        """替换消息的文本, 已有的测量结果作废, 只重排它之后的消息"""
+        if not message_text or not self.contains(message_text):
+            return
+        message_text.wrap.reset()
+        message_text.text = text
+        self.invalidate(message_text.index, message_text, scroll)
+
+    def append_message_text(self, message_text, delta):
+        """向消息追加增量文本, 不重写已有内容
+
+        Markdown消息只替换未结束的最后一行, 已完成的行保持不变。
+        """
+        if not message_text or not delta:
+            return
+        if not self.contains(message_text):
+            # 历史已被清空, 仍在生成的回答不再显示
+            return
+        if message_text.markdown is not None:
+            start, text, spans = message_text.feed_markdown(delta)
+            if message_text.row is not None:
+                message_text.row.replace_from(start, text, spans)
+            self.invalidate(message_text.index, message_text, True)
             return
-            
-        # 计算文本需要的高度和宽度
-        dc = wx.ClientDC(message_text)
-        dc.SetFont(message_text.GetFont())
-        
-        # 获取文本框的宽度（减去边距）
-        text_width = message_text.GetSize().width - 20
-        
-        # 计算所需的总高度
-        text_height = 0
-        line_height = dc.GetCharHeight()
-        
-        # 为每行计算高度和宽度
-        for line in text.split('\n'):
-            if not line:
-                text_height += line_height
-                continue
-                
-            # 计算这行文字需要多少个行高
-            extent = dc.GetPartialTextExtents(line)
-            if not extent:
-                text_height += line_height
-                continue
-                
-            # 计算换行
-            current_width = 0
-            for width in extent:
-                if width - current_width > text_width:
-                    text_height += line_height
-                    current_width = width
-            text_height += line_height
-        
-        # 设置新的大小
-        message_text.SetMinSize((text_width, text_height + 10))  # 添加一些边距
-        
-        # 更新布局
-        message_text.GetParent().Layout()
-        self.Layout()
-        self.FitInside()
-        self.scroll_to_bottom()
-        
+        if message_text.row is not None:
+            message_text.row.message_text.AppendText(delta)
+        # 追加不影响已测量的行, WrapMeasure 从上次的位置继续测量
+        message_text.append(delta)
+        self.invalidate(message_text.index, message_text, True)
+
     def add_message(self, sender, message):
         """添加消息到历史记录"""
         if sender == "AI":
             return  # AI消息由async_send_message处理
-            
-        message_text = self.create_message_panel(sender)
-        message_text.SetValue(message)
-        self.update_message_text_size(message_text, message)
-        
+
+        # 用户发送或系统提示时回到底部
+        self.follow_bottom = True
+        self.latest_message_text = self._append_item(sender, message)
+
+    def prepend_messages(self, messages):
+        """在顶部插入更早的一页消息 [(sender, text)], 保持当前可见内容的位置不变, 返回新建的消息"""
+        if not messages:
+            return []
+        if not self.client_width:
+            self.client_width = self.GetClientSize().width
+        # 先完成已排队的布局, 保证滚动位置的计算基于最新的位置
+        self.flush_layout()
+        view_top = self.GetViewStart()[1] * SCROLL_RATE
+        new_items = [MessageItem(self, sender, text) for sender, text in messages]
+        self.items[0:0] = new_items
+        for index, item in enumerate(self.items):
+            item.index = index
+        self.tops = [0]
+        self.relayout(0)
+        # 按新增内容的高度下移滚动位置
+        self.Scroll(-1, (view_top + self.tops[len(new_items)]) // SCROLL_RATE)
+        self.update_viewport()
+        return new_items
+
+    def focus_message(self, message_text, query=""):
+        """滚动到指定消息并把焦点移到它的文本框, 选中其中第一个匹配的查询词"""
+        self.flush_layout()
+        view_top = self.GetViewStart()[1] * SCROLL_RATE
+        top = self.tops[message_text.index]
+        bottom = top + message_text.height
+        if top < view_top or bottom > view_top + self.GetClientSize().height:
+            self.Scroll(-1, top // SCROLL_RATE)
+        self.update_viewport()
+        if message_text.row is None:
+            return
+        text_ctrl = message_text.row.message_text
+        text_ctrl.SetFocus()
+        value = message_text.text.lower()
+        for word in query.split():
+            position = value.find(word.lower())
+            if position >= 0:
+                # 文本框中的位置可能与字符下标不同(见 native_length)
+                start = native_length(value[:position])
+                end = start + native_length(value[position:position + len(word)])
+                text_ctrl.SetSelection(start, end)
+                text_ctrl.ShowPosition(start)
+                break
+
+    def focus_neighbour(self, message_text, step):
+        """焦点移到上一条或下一条消息"""
+        index = message_text.index + step
+        if 0 <= index < len(self.items):
+            self.focus_message(self.items[index])
+        elif index < 0:
+            self.check_reach_top()
+
     def scroll_to_bottom(self):
-        """确保滚动到底部"""
-        # 强制更新布局
-        self.Layout()
-        self.FitInside()
-        
-        # 获取虚拟大小和实际大小
-        virtual_size = self.GetVirtualSize()
-        client_size = self.GetClientSize()
-        
-        # 计算最大滚动位置
-        max_scroll = max(0, virtual_size[1] - client_size[1])
-        
-        # 滚动到底部
-        self.Scroll(0, max_scroll)
-        
-        # 强制刷新显示
-        self.Refresh()
-        
+        """滚动到底部并恢复自动跟随, 在下一次布局时执行"""
+        self.follow_bottom = True
+        self.invalidate(len(self.items), scroll=True)
+
+    def contains(self, item):
+        """消息是否仍在当前历史中(清空历史后, 进行中的回答仍持有旧的消息)"""
+        return item.index < len(self.items) and self.items[item.index] is item
+
     def clear_history(self):
         """清空历史记录"""
-        for child in self.GetChildren():
-            child.Destroy()
-        self.history_sizer.Clear()
+        for row in self.rows + self.spare_rows:
+            # 先解除绑定, 仍在生成的消息不能再引用即将销毁的控件
+            row.unbind()
+            row.panel.Destroy()
+        self.rows = []
+        self.spare_rows = []
+        self.items = []
+        self.tops = [0]
+        self.dirty_from = None
+        self.dirty_items = set()
+        self.follow_bottom = True
         self.latest_message_text = None
-        self.Layout()
+        self.SetVirtualSize((self.client_width, 0))
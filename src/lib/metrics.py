@@ -0,0 +1,259 @@
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from .context_window import estimate_tokens
+from .logger_manager import LoggerManager
+
+# 当前协程上下文中正在记录的请求, 供底层连接代码标记首字节时间
+current_request = contextvars.ContextVar('current_request', default=None)
+
+# 直方图桶边界(秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# 生成速度的桶边界(token/秒)
+RATE_BUCKETS = (1, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class RollingHistogram:
+    """只统计最近 window 个样本的滚动直方图"""
+
+    def __init__(self, window=500, buckets=DEFAULT_BUCKETS):
+        self.samples = deque(maxlen=window)
+        self.buckets = buckets
+
+    def observe(self, value):
+        self.samples.append(value)
+
+    def snapshot(self):
+        """返回样本数、分位数和累计桶计数"""
+        ordered = sorted(self.samples)
+        count = len(ordered)
+        if not count:
+            return {'count': 0}
+
+        def quantile(q):
+            return ordered[int(q * (count - 1))]
+
+        cumulative = []
+        index = 0
+        for bound in self.buckets:
+            while index < count and ordered[index] <= bound:
+                index += 1
+            cumulative.append((bound, index))
+        return {
+            'count': count,
+            'sum': sum(ordered),
+            'mean': sum(ordered) / count,
+            'p50': quantile(0.5),
+            'p95': quantile(0.95),
+            'p99': quantile(0.99),
+            'max': ordered[-1],
+            'buckets': cumulative,
+        }
+
+
+# 请求id的序号, 与进程启动时间一起保证日志中的id不重复
+_request_ids = itertools.count(1)
+_process_tag = f"{int(time.time()):x}-{os.getpid():x}"
+
+class RequestMetrics:
+    """单次请求的延迟记录
+
+    时间点均为 time.perf_counter() 的值; 由事件循环线程写入,
+    ui_apply 由GUI线程写入并直接汇总到注册表。
+    """
+
+    def __init__(self, agent, model, registry=None):
+        # 结构化日志中用于关联同一请求的各条记录
+        self.request_id = f"{_process_tag}-{next(_request_ids)}"
+        self.agent = agent
+        self.model = model
+        self.registry = registry or MetricsRegistry.get_registry()
+        self.start = time.perf_counter()
+        self.first_byte = None
+        self.first_token = None
+        self.last_chunk = None
+        self.gaps = []
+        self.chunks = 0
+        self.tokens = 0
+        self.cache_hit = False
+        self.error = None
+        self.end = None
+        # 最近一次推送给界面的增量中最早的片段到达时间
+        self.flush_arrival = None
+
+    def mark_first_byte(self):
+        """收到响应头(流已建立)"""
+        if self.first_byte is None:
+            self.first_byte = time.perf_counter()
+
+    def mark_chunk(self):
+        """收到一个内容增量, 返回到达时间"""
+        now = time.perf_counter()
+        if self.first_token is None:
+            self.first_token = now
+            self.mark_first_byte()
+        else:
+            self.gaps.append(now - self.last_chunk)
+        self.last_chunk = now
+        self.chunks += 1
+        return now
+
+    def mark_ui_apply(self, arrival):
+        """界面实际应用某次增量, 记录从增量到达至界面执行的延迟"""
+        self.registry.observe(self.agent, self.model, 'ui_apply', time.perf_counter() - arrival)
+
+    def finish(self, text="", error=None):
+        """请求结束, 汇总到注册表"""
+        self.end = time.perf_counter()
+        self.error = error
+        self.tokens = estimate_tokens(text) if text else 0
+        self.registry.record(self)
+
+
+class MetricsRegistry:
+    """按agent/model汇总请求指标, 并定期导出到logs目录"""
+
+    _instance = None
+    _lock = threading.Lock()
+
+    METRICS = ('ttfb', 'ttft', 'inter_token_gap', 'total', 'ui_apply', 'tokens_per_second')
+
+    def __init__(self, export_interval=5.0, logs_dir=None):
+        self.logger = LoggerManager.get_logger()
+        self.lock = threading.Lock()
+        self.series = {}
+        self.export_interval = export_interval
+        self._export_timer = None
+        if logs_dir is None:
+            logs_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs')
+        self.logs_dir = logs_dir
+
+    @classmethod
+    def get_registry(cls):
+        """获取全局注册表实例"""
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def _series(self, agent, model):
+        key = (agent, model)
+        if key not in self.series:
+            self.series[key] = {
+                'requests': 0,
+                'errors': 0,
+                'cache_hits': 0,
+                'chunks': 0,
+                'tokens': 0,
+                'histograms': {
+                    name: RollingHistogram(buckets=RATE_BUCKETS if name == 'tokens_per_second' else DEFAULT_BUCKETS)
+                    for name in self.METRICS
+                },
+            }
+        return self.series[key]
+
+    def observe(self, agent, model, metric, value):
+        """记录单个样本"""
+        with self.lock:
+            self._series(agent, model)['histograms'][metric].observe(value)
+        self._schedule_export()
+
+    def record(self, request):
+        """汇总一次完成的请求"""
+        with self.lock:
+            series = self._series(request.agent, request.model)
+            series['requests'] += 1
+            series['chunks'] += request.chunks
+            series['tokens'] += request.tokens
+            if request.error is not None:
+                series['errors'] += 1
+            if request.cache_hit:
+                series['cache_hits'] += 1
+            histograms = series['histograms']
+            if request.first_byte is not None:
+                histograms['ttfb'].observe(request.first_byte - request.start)
+            if request.first_token is not None:
+                histograms['ttft'].observe(request.first_token - request.start)
+                generation = request.last_chunk - request.first_token
+                if generation > 0 and request.tokens:
+                    histograms['tokens_per_second'].observe(request.tokens / generation)
+            for gap in request.gaps:
+                histograms['inter_token_gap'].observe(gap)
+            histograms['total'].observe(request.end - request.start)
+        self._schedule_export()
+
+    def snapshot(self):
+        """返回所有序列的汇总数据"""
+        with self.lock:
+            result = []
+            for (agent, model), series in sorted(self.series.items()):
+                result.append({
+                    'agent': agent,
+                    'model': model,
+                    'requests': series['requests'],
+                    'errors': series['errors'],
+                    'cache_hits': series['cache_hits'],
+                    'chunks': series['chunks'],
+                    'tokens': series['tokens'],
+                    'histograms': {name: h.snapshot() for name, h in series['histograms'].items()},
+                })
+            return result
+
+    def _schedule_export(self):
+        """合并短时间内的多次更新, 最多每 export_interval 秒写一次文件"""
+        with self.lock:
+            if self._export_timer is not None:
+                return
+            self._export_timer = threading.Timer(self.export_interval, self.export)
+            self._export_timer.daemon = True
+            self._export_timer.start()
+
+    def export(self):
+        """把指标写成 metrics.json 和 Prometheus 文本格式的 metrics.prom"""
+        with self.lock:
+            self._export_timer = None
+        snapshot = self.snapshot()
+        try:
+            if not os.path.exists(self.logs_dir):
+                os.makedirs(self.logs_dir)
+            self._write(os.path.join(self.logs_dir, 'metrics.json'),
+                        json.dumps(snapshot, ensure_ascii=False, indent=2))
+            self._write(os.path.join(self.logs_dir, 'metrics.prom'), self.to_prometheus(snapshot))
+        except OSError as e:
+            self.logger.warning(f"导出指标失败: {str(e)}")
+
+    def _write(self, path, text):
+        """先写临时文件再替换, 读取方不会看到写了一半的文件"""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def to_prometheus(snapshot):
+        """转换为Prometheus文本格式"""
+        lines = []
+        for metric in MetricsRegistry.METRICS:
+            name = f'chat_{metric}' if metric == 'tokens_per_second' else f'chat_{metric}_seconds'
+            lines.append(f'# TYPE {name} histogram')
+            for series in snapshot:
+                labels = f'agent="{series["agent"]}",model="{series["model"]}"'
+                hist = series['histograms'][metric]
+                if not hist['count']:
+                    continue
+                for bound, count in hist['buckets']:
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {hist["count"]}')
+                lines.append(f'{name}_sum{{{labels}}} {hist["sum"]}')
+                lines.append(f'{name}_count{{{labels}}} {hist["count"]}')
+        for counter in ('requests', 'errors', 'cache_hits', 'chunks', 'tokens'):
+            name = f'chat_{counter}_total'
+            lines.append(f'# TYPE {name} counter')
+            for series in snapshot:
+                labels = f'agent="{series["agent"]}",model="{series["model"]}"'
+                lines.append(f'{name}{{{labels}}} {series[counter]}')
+        return "\n".join(lines) + "\n"
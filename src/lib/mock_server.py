@@ -0,0 +1,203 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class MockSettings:
+    """模拟服务器的行为参数"""
+
+    def __init__(self, token_rate=50.0, chunk_size=1, first_token_delay=0.3,
+                 response_tokens=200, error_rate=0.0, error_status=503, retry_after=1,
+                 token_text="token "):
+        self.token_rate = token_rate              # 每秒产出的token数
+        self.chunk_size = chunk_size              # 每个SSE块包含的token数
+        self.first_token_delay = first_token_delay  # 首个token前的等待秒数
+        self.response_tokens = response_tokens    # 每个回答的token总数
+        self.error_rate = error_rate              # 注入错误的概率(0~1)
+        self.error_status = error_status          # 注入错误时返回的状态码
+        self.retry_after = retry_after            # 429/503时的Retry-After秒数
+        self.token_text = token_text              # 每个token的文本
+
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    """兼容OpenAI chat-completions流式协议的请求处理器"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # 基准测试时不输出访问日志
+        pass
+
+    def do_HEAD(self):
+        # 连接预热请求
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/models'):
+            self._send_json(200, {"object": "list", "data": [{"id": "mock-model", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        settings = self.server.settings
+        if settings.error_rate and random.random() < settings.error_rate:
+            self._send_error(settings)
+            return
+
+        model = body.get("model", "mock-model")
+        if body.get("stream"):
+            self._stream_response(settings, model)
+        else:
+            self._full_response(settings, model)
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, settings):
+        headers = {}
+        if settings.error_status in (429, 503):
+            headers["Retry-After"] = str(settings.retry_after)
+        self._send_json(settings.error_status, {
+            "error": {"message": "mock injected error", "type": "mock_error", "code": settings.error_status}
+        }, headers)
+
+    def _full_response(self, settings, model):
+        time.sleep(settings.first_token_delay + settings.response_tokens / settings.token_rate)
+        self._send_json(200, {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": settings.token_text * settings.response_tokens},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": settings.response_tokens,
+                      "total_tokens": settings.response_tokens}
+        })
+
+    def _write_chunk(self, payload):
+        """以chunked编码写出一个SSE事件"""
+        if payload == "[DONE]":
+            data = b"data: [DONE]\n\n"
+        else:
+            data = ("data: " + json.dumps(payload, ensure_ascii=False) + "\n\n").encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _stream_response(self, settings, model):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(delta, finish_reason=None):
+            return {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+
+        try:
+            self._write_chunk(chunk({"role": "assistant", "content": ""}))
+            time.sleep(settings.first_token_delay)
+
+            # 按设定的token速率发送, 以开始时间为基准避免误差累积
+            start = time.perf_counter()
+            sent = 0
+            while sent < settings.response_tokens:
+                count = min(settings.chunk_size, settings.response_tokens - sent)
+                self._write_chunk(chunk({"content": settings.token_text * count}))
+                sent += count
+                delay = start + sent / settings.token_rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+            self._write_chunk(chunk({}, "stop"))
+            self._write_chunk("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端取消了请求(例如对冲请求中落后的一方)
+            pass
+
+
+class MockOpenAIServer:
+    """本地离线的OpenAI兼容服务器, 用于测量客户端自身的开销"""
+
+    def __init__(self, host="127.0.0.1", port=0, settings=None):
+        self.httpd = ThreadingHTTPServer((host, port), MockRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.settings = settings or MockSettings()
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        """在后台线程中启动服务器"""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="MockOpenAIServer", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟OpenAI chat-completions流式服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--token-rate", type=float, default=50.0, help="每秒token数")
+    parser.add_argument("--chunk-size", type=int, default=1, help="每个SSE块的token数")
+    parser.add_argument("--first-token-delay", type=float, default=0.3, help="首个token前的等待秒数")
+    parser.add_argument("--response-tokens", type=int, default=200, help="每个回答的token数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入错误的概率(0~1)")
+    parser.add_argument("--error-status", type=int, default=503, help="注入错误时的HTTP状态码")
+    args = parser.parse_args()
+
+    settings = MockSettings(
+        token_rate=args.token_rate,
+        chunk_size=args.chunk_size,
+        first_token_delay=args.first_token_delay,
+        response_tokens=args.response_tokens,
+        error_rate=args.error_rate,
+        error_status=args.error_status
+    )
+    server = MockOpenAIServer(args.host, args.port, settings)
+    # 供父进程读取实际地址
+    print(server.base_url, flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+import threading
+import time
+from .logger_manager import LoggerManager
+
+# 默认provider的名字, 使用全局 openai 配置
+DEFAULT_PROVIDER = 'default'
+# 客户端空闲多久(秒)后被回收, 可在 openai.client_idle_seconds 中修改
+DEFAULT_IDLE_SECONDS = 600
+
+class ProviderRegistry:
+    """按provider共享的AsyncOpenAI客户端
+
+    agent通过 "provider": "名字" 选择 providers 配置中的一项, 未指定时使用
+    全局 openai 配置。每个provider可以单独设置 base_url(或 base_urls)、api_key、
+    timeout、connect_timeout 和 headers:
+
+        "providers": {
+            "local": {"base_url": "http://127.0.0.1:4000/v1", "api_key": "",
+                      "timeout": 120, "connect_timeout": 5,
+                      "headers": {"X-Gateway-Team": "chat"}}
+        }
+
+    客户端在第一次使用时创建, 同一个 (provider, base_url) 的所有agent共用一个;
+    同一个base_url的HTTP连接池由 HttpPool 共享。超过空闲时间未使用的客户端被回收,
+    没有客户端再使用的连接池交给 async_runner 在事件循环中关闭。
+    """
+
+    def __init__(self, config, http_pool, idle_seconds=None):
+        self.logger = LoggerManager.get_logger()
+        self.config = config
+        self.http_pool = http_pool
+        self.idle_seconds = idle_seconds or config['openai'].get('client_idle_seconds', DEFAULT_IDLE_SECONDS)
+        # (provider, base_url) -> [AsyncOpenAI客户端, 最近使用时间]
+        self.clients = {}
+        self.lock = threading.Lock()
+        # 在客户端所属的事件循环中执行协程, 用于关闭回收的连接池
+        self.async_runner = None
+
+    def provider(self, name):
+        """provider的配置, default为全局openai配置"""
+        if name in (None, DEFAULT_PROVIDER) and DEFAULT_PROVIDER not in self.config.get('providers', {}):
+            return self.config['openai']
+        provider = self.config.get('providers', {}).get(name)
+        if provider is None:
+            raise ValueError(f"provider不存在: {name}")
+        return provider
+
+    def endpoints(self, agent):
+        """agent可用的base_url列表, 依次为agent配置、provider配置和provider的base_url"""
+        provider = self.provider(agent.get('provider'))
+        return (agent.get('base_urls')
+                or provider.get('base_urls')
+                or [provider['base_url']])
+
+    def get_async_client(self, provider_name=None, base_url=None):
+        """获取provider在某个endpoint上的客户端, 不存在时创建"""
+        name = provider_name or DEFAULT_PROVIDER
+        provider = self.provider(name)
+        base_url = base_url or provider['base_url']
+        key = (name, base_url)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.clients.get(key)
+            if entry is None:
+                entry = self.clients[key] = [self._create(provider, base_url), now]
+                self.logger.debug(f"创建客户端: provider={name}, {base_url}")
+            entry[1] = now
+            client = entry[0]
+        self.evict_idle(now)
+        return client
+
+    def get_async_clients(self, agent):
+        """agent所有endpoint对应的客户端, 第一个为首选"""
+        name = agent.get('provider')
+        return [self.get_async_client(name, url) for url in self.endpoints(agent)]
+
+    def _create(self, provider, base_url):
+        """创建AsyncOpenAI客户端; 重试与故障转移由AsyncChatClient负责, 因此关闭SDK自带的重试"""
+        import httpx
+        from openai import AsyncOpenAI
+        kwargs = {}
+        if 'timeout' in provider or 'connect_timeout' in provider:
+            kwargs['timeout'] = httpx.Timeout(provider.get('timeout', 600),
+                                              connect=provider.get('connect_timeout', 5.0))
+        return AsyncOpenAI(
+            api_key=provider.get('api_key', ''),
+            base_url=base_url,
+            default_headers=provider.get('headers') or None,
+            http_client=self.http_pool.get_async_client(base_url),
+            max_retries=0,
+            **kwargs
+        )
+
+    def evict_idle(self, now=None):
+        """回收空闲超时的客户端, 返回回收的数量"""
+        now = now or time.monotonic()
+        with self.lock:
+            idle = [key for key, (_, used) in self.clients.items() if now - used > self.idle_seconds]
+            if not idle:
+                return 0
+            for key in idle:
+                del self.clients[key]
+            # 持有锁时移除连接池, 避免同时创建的客户端拿到即将关闭的连接池
+            in_use = {base_url for _, base_url in self.clients}
+            released = [self.http_pool.release_async_client(base_url)
+                        for base_url in {base_url for _, base_url in idle} - in_use]
+        self.logger.info(f"回收{len(idle)}个空闲客户端: {', '.join(f'{name}@{url}' for name, url in idle)}")
+        for client in released:
+            if client is not None and self.async_runner is not None:
+                self.async_runner(client.aclose())
+        return len(idle)
+
+    def clear(self):
+        """丢弃所有客户端(连接配置变化时调用), 连接池保留给新客户端复用"""
+        with self.lock:
+            self.clients.clear()
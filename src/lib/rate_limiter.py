@@ -0,0 +1,154 @@
+import asyncio
+import time
+from collections import deque
+from .logger_manager import LoggerManager
+
+class TokenBucket:
+    """令牌桶: 容量为每分钟额度, 按秒匀速补充"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def wait_time(self, amount, now):
+        """获取amount个令牌还需要等待的秒数"""
+        self._refill(now)
+        # 单次请求超过桶容量时按整桶计算, 避免永远等不到
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount):
+        """扣除令牌, 允许透支(透支部分由后续请求等待补齐)"""
+        self.tokens -= amount
+
+
+class EndpointLimiter:
+    """单个 (base_url, model) 的请求桶和token桶
+
+    等待者按先来先服务排队, 由一个调度协程依次放行, 不会出现后来的小请求
+    一直插队导致大请求饿死的情况。
+    """
+
+    def __init__(self, rpm=None, tpm=None):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.queue = deque()
+        self.blocked_until = 0.0
+        self.dispatcher = None
+
+    @property
+    def depth(self):
+        return len(self.queue)
+
+    async def acquire(self, tokens):
+        """排队等待直到两个桶都有足够额度"""
+        future = asyncio.get_running_loop().create_future()
+        self.queue.append((future, tokens))
+        if self.dispatcher is None or self.dispatcher.done():
+            self.dispatcher = asyncio.ensure_future(self._dispatch())
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 请求被取消(例如对冲中落后的一方), 让出队列位置
+            if (future, tokens) in self.queue:
+                self.queue.remove((future, tokens))
+            raise
+
+    async def _dispatch(self):
+        while self.queue:
+            future, tokens = self.queue[0]
+            if future.done():
+                self.queue.popleft()
+                continue
+            now = time.monotonic()
+            wait = max(
+                self.blocked_until - now,
+                self.requests.wait_time(1, now) if self.requests else 0.0,
+                self.tokens.wait_time(tokens, now) if self.tokens else 0.0
+            )
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            self.queue.popleft()
+            if self.requests:
+                self.requests.consume(1)
+            if self.tokens:
+                self.tokens.consume(tokens)
+            future.set_result(None)
+
+    def charge(self, tokens):
+        """请求完成后补扣实际生成的token"""
+        if self.tokens:
+            self.tokens.consume(tokens)
+
+    def block(self, seconds):
+        """服务端要求等待(Retry-After), 在此之前暂停放行"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class RateLimiter:
+    """按 (base_url, model) 分别限流的共享限流器
+
+    规则来自config.json的 rate_limits 列表, 每项包含 base_url、model、rpm、tpm,
+    base_url和model可以写 "*" 匹配任意值, 按顺序取第一条匹配的规则。
+    没有匹配规则的endpoint不限流。所有方法都应在事件循环线程中调用,
+    queue_depth 只读取队列长度, 可以从GUI线程调用。
+    """
+
+    def __init__(self, rules=None):
+        self.logger = LoggerManager.get_logger()
+        self.rules = rules or []
+        self.limiters = {}
+
+    def update_rules(self, rules):
+        """替换规则; 已在旧限流器中排队的请求按旧规则放行, 之后的请求使用新规则"""
+        self.rules = rules or []
+        self.limiters = {}
+
+    def _rule(self, base_url, model):
+        for rule in self.rules:
+            if rule.get('base_url', '*') in ('*', base_url) and rule.get('model', '*') in ('*', model):
+                return rule
+        return None
+
+    def _limiter(self, base_url, model):
+        key = (base_url, model)
+        if key not in self.limiters:
+            rule = self._rule(base_url, model)
+            self.limiters[key] = EndpointLimiter(rule.get('rpm'), rule.get('tpm')) if rule else None
+        return self.limiters[key]
+
+    async def acquire(self, base_url, model, tokens):
+        """请求前调用, 额度不足时排队等待"""
+        limiter = self._limiter(base_url, model)
+        if limiter is None:
+            return
+        if limiter.depth:
+            self.logger.debug(f"{base_url} {model} 限流排队, 前方{limiter.depth}个请求",
+                              extra={'event': 'rate_limit_queue'})
+        await limiter.acquire(tokens)
+
+    def charge(self, base_url, model, tokens):
+        limiter = self._limiter(base_url, model)
+        if limiter is not None:
+            limiter.charge(tokens)
+
+    def on_rate_limited(self, base_url, model, retry_after):
+        """收到429时调用, 该endpoint在retry_after秒内不再放行新请求"""
+        limiter = self._limiter(base_url, model)
+        if limiter is None:
+            # 没有配置规则也要遵守服务端的Retry-After
+            limiter = self.limiters[(base_url, model)] = EndpointLimiter()
+        limiter.block(retry_after)
+
+    def queue_depth(self):
+        """所有endpoint排队等待的请求总数"""
+        return sum(limiter.depth for limiter in list(self.limiters.values()) if limiter is not None)
@@ -0,0 +1,90 @@
+import threading
+import wx
+from .logger_manager import LoggerManager
+
+# 渲染帧间隔(毫秒), 约30帧每秒
+FRAME_INTERVAL_MS = 33
+
+class RenderMailbox:
+    """工作线程与GUI线程之间的合并邮箱
+
+    每条消息只保留一个待渲染条目, 同一帧内到达的多个增量合并为一次更新,
+    GUI线程落后时也不会在事件队列里堆积。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.finished = []
+
+    def post(self, target, delta, arrival=None, metrics=None):
+        """投递增量(任意线程), arrival为本批中最早片段的到达时间"""
+        with self.lock:
+            entry = self.pending.get(id(target))
+            if entry is None:
+                self.pending[id(target)] = [target, [delta], arrival, metrics]
+            else:
+                entry[1].append(delta)
+
+    def finish(self, target):
+        """标记某条消息的流已结束(任意线程)"""
+        with self.lock:
+            self.finished.append(target)
+
+    def drain(self):
+        """取出所有待渲染条目和已结束的消息(GUI线程)"""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            finished, self.finished = self.finished, []
+        return list(pending.values()), finished
+
+
+class RenderLoop:
+    """GUI线程的渲染节拍
+
+    有流在进行时以固定帧率运行 wx.Timer, 每帧把邮箱中的增量一次性应用到界面,
+    每条消息每帧最多更新一次; 所有流结束且邮箱清空后停止计时器。
+    """
+
+    def __init__(self, owner, apply_func, interval_ms=FRAME_INTERVAL_MS):
+        self.logger = LoggerManager.get_logger()
+        self.mailbox = RenderMailbox()
+        self.apply_func = apply_func
+        self.interval_ms = interval_ms
+        self.active = 0
+        self.timer = wx.Timer(owner)
+        owner.Bind(wx.EVT_TIMER, self.OnTick, self.timer)
+
+    def stream_started(self):
+        """新的流开始(GUI线程), 消息面板此时已经创建完毕"""
+        self.active += 1
+        if not self.timer.IsRunning():
+            self.timer.Start(self.interval_ms)
+
+    def post(self, target, delta, arrival=None, metrics=None):
+        self.mailbox.post(target, delta, arrival, metrics)
+
+    def stream_finished(self, target):
+        self.mailbox.finish(target)
+
+    def OnTick(self, event):
+        pending, finished = self.mailbox.drain()
+        try:
+            for target, parts, arrival, metrics in pending:
+                # 一条消息更新失败不影响同一帧中的其他消息
+                try:
+                    self.apply_func(target, "".join(parts))
+                except Exception as e:
+                    self.logger.error(f"应用增量失败: {str(e)}", exc_info=True)
+                    continue
+                if metrics is not None and arrival is not None:
+                    metrics.mark_ui_apply(arrival)
+        finally:
+            # 无论更新是否出错都要计入已结束的流, 否则计时器不会停止
+            self.active -= len(finished)
+            if self.active <= 0:
+                self.active = 0
+                self.timer.Stop()
+
+    def stop(self):
+        self.timer.Stop()
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from .logger_manager import LoggerManager
+
+class ResponseCache:
+    """两级响应缓存: 内存LRU + 磁盘文件
+
+    缓存键为 (base_url, model, messages) 的哈希, 内容相同的请求命中同一条缓存。
+    磁盘层按总大小淘汰最久未使用的文件。
+    """
+
+    def __init__(self, cache_dir=None, max_memory_entries=128, max_disk_bytes=50*1024*1024):
+        self.logger = LoggerManager.get_logger()
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+
+        # 缓存目录, 默认与logs目录同级
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cache')
+        self.cache_dir = cache_dir
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+        # 按修改时间排序记录磁盘文件, 最旧的在前
+        self.disk_index = OrderedDict()
+        self.disk_bytes = 0
+        self._scan_disk()
+
+    @staticmethod
+    def make_key(base_url, model, messages):
+        """根据请求内容计算缓存键"""
+        payload = json.dumps([base_url, model, messages], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.json')
+
+    def _scan_disk(self):
+        """启动时扫描磁盘缓存, 建立大小索引"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json'):
+                continue
+            stat = os.stat(os.path.join(self.cache_dir, name))
+            entries.append((stat.st_mtime, name[:-5], stat.st_size))
+        for _, key, size in sorted(entries):
+            self.disk_index[key] = size
+            self.disk_bytes += size
+
+    def get(self, key):
+        """查找缓存, 未命中返回None"""
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return self.memory[key]
+            if key not in self.disk_index:
+                return None
+            try:
+                with open(self._path(key), 'r', encoding='utf-8') as f:
+                    text = json.load(f)['response']
+                os.utime(self._path(key))
+            except (OSError, ValueError, KeyError) as e:
+                self.logger.warning(f"读取磁盘缓存失败 {key}: {str(e)}")
+                self._remove_disk(key)
+                return None
+            self.disk_index.move_to_end(key)
+            self._put_memory(key, text)
+            return text
+
+    def put(self, key, text):
+        """写入两级缓存"""
+        with self.lock:
+            self._put_memory(key, text)
+            try:
+                data = json.dumps({'response': text}, ensure_ascii=False)
+                with open(self._path(key), 'w', encoding='utf-8') as f:
+                    f.write(data)
+            except OSError as e:
+                self.logger.warning(f"写入磁盘缓存失败 {key}: {str(e)}")
+                return
+            self.disk_bytes -= self.disk_index.pop(key, 0)
+            self.disk_index[key] = os.path.getsize(self._path(key))
+            self.disk_bytes += self.disk_index[key]
+            self._evict_disk()
+
+    def _put_memory(self, key, text):
+        self.memory[key] = text
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_entries:
+            self.memory.popitem(last=False)
+
+    def _remove_disk(self, key):
+        self.disk_bytes -= self.disk_index.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict_disk(self):
+        """超出容量时删除最久未使用的文件"""
+        while self.disk_bytes > self.max_disk_bytes and len(self.disk_index) > 1:
+            oldest = next(iter(self.disk_index))
+            self._remove_disk(oldest)
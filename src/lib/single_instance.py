@@ -0,0 +1,157 @@
+import json
+import os
+import secrets
+import socket
+import threading
+from .logger_manager import LoggerManager
+
+# 本机IPC监听的默认端口, 可在配置 ipc.port 中修改
+DEFAULT_PORT = 47651
+# 单条命令的最大字节数
+MAX_COMMAND_BYTES = 1024 * 1024
+# 令牌文件, 只有能读取该文件的本机用户才能向运行中的实例发送命令
+TOKEN_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'instance.token')
+
+def read_token(token_path=TOKEN_PATH):
+    try:
+        with open(token_path, 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def send_command(command, port=DEFAULT_PORT, token_path=TOKEN_PATH, timeout=2.0):
+    """把命令转发给运行中的实例, 返回实例的回复; 没有运行中的实例时返回None
+
+    协议为一行JSON请求和一行JSON回复:
+        {"token": "...", "command": "show" | "ask" | "open", ...参数}
+        {"ok": true} 或 {"ok": false, "error": "..."}
+    """
+    token = read_token(token_path)
+    if token is None:
+        return None
+    try:
+        with socket.create_connection(('127.0.0.1', port), timeout=timeout) as conn:
+            conn.sendall(json.dumps(dict(command, token=token), ensure_ascii=False).encode('utf-8') + b'\n')
+            with conn.makefile('rb') as reader:
+                line = reader.readline(MAX_COMMAND_BYTES)
+    except OSError:
+        return None
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+class InstanceServer:
+    """单实例服务端
+
+    第一个启动的进程独占本机端口并监听命令, 之后启动的进程用 send_command
+    把命令行参数转发过来后立即退出, 不再重复初始化界面、托盘图标和全局热键。
+    监听只绑定127.0.0.1, 每条命令需要带上令牌文件中的随机令牌。
+    handler 在监听线程中调用, 抛出异常时回复错误信息; 窗口创建完成前
+    收到的命令先缓存, set_handler 时依次处理。
+    """
+
+    def __init__(self, handler=None, port=DEFAULT_PORT, token_path=TOKEN_PATH):
+        self.logger = LoggerManager.get_logger()
+        self.handler = handler
+        self.pending = []
+        self.lock = threading.Lock()
+        self.port = port
+        self.token_path = token_path
+        self.token = None
+        self.sock = None
+        self.thread = None
+
+    def start(self):
+        """尝试成为唯一实例, 端口已被占用(已有实例在运行)时返回False"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if hasattr(socket, 'SO_EXCLUSIVEADDRUSE'):
+            # Windows下默认允许其他进程用SO_REUSEADDR抢占端口
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1)
+        else:
+            # POSIX下SO_REUSEADDR不允许两个进程同时监听, 只是让重启时不必等待TIME_WAIT
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind(('127.0.0.1', self.port))
+            sock.listen(8)
+        except OSError:
+            sock.close()
+            return False
+        self.sock = sock
+        self.token = secrets.token_hex(16)
+        self._write_token()
+        self.thread = threading.Thread(target=self._serve, name="InstanceServer", daemon=True)
+        self.thread.start()
+        self.logger.info(f"单实例服务已在端口{self.port}启动")
+        return True
+
+    def _write_token(self):
+        directory = os.path.dirname(os.path.abspath(self.token_path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        fd = os.open(self.token_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(self.token)
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                # 套接字已关闭
+                break
+            with conn:
+                conn.settimeout(2.0)
+                try:
+                    self._handle(conn)
+                except OSError as e:
+                    self.logger.warning(f"处理IPC连接失败: {str(e)}")
+
+    def _handle(self, conn):
+        with conn.makefile('rb') as reader:
+            line = reader.readline(MAX_COMMAND_BYTES)
+        try:
+            command = json.loads(line)
+            if not isinstance(command, dict):
+                raise ValueError("命令必须是JSON对象")
+        except ValueError as e:
+            reply = {'ok': False, 'error': f"无效的命令: {str(e)}"}
+        else:
+            token = str(command.pop('token', '')).encode('utf-8')
+            if not secrets.compare_digest(token, self.token.encode('utf-8')):
+                reply = {'ok': False, 'error': "令牌无效"}
+            else:
+                self.logger.info(f"收到IPC命令: {command.get('command')}")
+                with self.lock:
+                    handler = self.handler
+                    if handler is None:
+                        self.pending.append(command)
+                try:
+                    if handler is not None:
+                        handler(command)
+                    reply = {'ok': True}
+                except Exception as e:
+                    reply = {'ok': False, 'error': str(e)}
+        conn.sendall(json.dumps(reply, ensure_ascii=False).encode('utf-8') + b'\n')
+
+    def set_handler(self, handler):
+        """设置命令处理函数, 并处理之前缓存的命令"""
+        with self.lock:
+            self.handler = handler
+            pending, self.pending = self.pending, []
+        for command in pending:
+            try:
+                handler(command)
+            except Exception as e:
+                self.logger.warning(f"处理缓存的IPC命令失败: {str(e)}")
+
+    def close(self):
+        """停止监听, 之后可以立即启动新的实例"""
+        if self.sock is not None:
+            # 先shutdown唤醒阻塞在accept中的监听线程, 否则端口在线程退出前仍被占用
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.sock.close()
+            self.sock = None
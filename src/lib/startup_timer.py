@@ -0,0 +1,63 @@
+import threading
+import time
+from .logger_manager import LoggerManager
+
+# 启动到可交互的默认预算(毫秒), 可在配置 startup.budget_ms 中修改
+DEFAULT_BUDGET_MS = 1000
+
+class StartupTimer:
+    """记录启动各阶段的耗时
+
+    mark 记录从上一个阶段结束到现在的耗时; 后台线程中的阶段用 mark_background,
+    单独从启动时刻计时, 不影响前台阶段的划分。窗口可交互时调用 report,
+    按阶段把毫秒数写入日志, 超过预算时记为警告。
+    """
+
+    def __init__(self, start=None):
+        self.start = start if start is not None else time.perf_counter()
+        self.last = self.start
+        self.phases = []
+        self.background = []
+        self.lock = threading.Lock()
+        self.reported = False
+
+    def mark(self, phase):
+        """前台阶段结束"""
+        now = time.perf_counter()
+        with self.lock:
+            self.phases.append((phase, (now - self.last) * 1000))
+            self.last = now
+
+    def mark_background(self, phase, started):
+        """后台阶段结束, started为该阶段开始的perf_counter时间"""
+        now = time.perf_counter()
+        with self.lock:
+            self.background.append((phase, (now - started) * 1000, (now - self.start) * 1000))
+            reported = self.reported
+        if reported:
+            self._log_background(phase, (now - started) * 1000, (now - self.start) * 1000)
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+    def report(self, budget_ms=DEFAULT_BUDGET_MS):
+        """写出到可交互为止的各阶段耗时, 返回总耗时(毫秒)"""
+        logger = LoggerManager.get_logger()
+        total = self.elapsed_ms()
+        with self.lock:
+            self.reported = True
+            phases = list(self.phases)
+            background = list(self.background)
+        detail = ", ".join(f"{phase} {ms:.0f}ms" for phase, ms in phases)
+        message = f"启动耗时: 可交互 {total:.0f}ms (预算 {budget_ms}ms) [{detail}]"
+        if total > budget_ms:
+            logger.warning(message)
+        else:
+            logger.info(message)
+        for phase, ms, at in background:
+            self._log_background(phase, ms, at)
+        return total
+
+    @staticmethod
+    def _log_background(phase, ms, at):
+        LoggerManager.get_logger().info(f"启动耗时: 后台 {phase} {ms:.0f}ms (完成于启动后 {at:.0f}ms)")
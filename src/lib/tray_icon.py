@@ -0,0 +1,23 @@
+import wx
+from wx.adv import TaskBarIcon
+
+class ChatTrayIcon(TaskBarIcon):
+    def __init__(self, frame):
+        super().__init__()
+        self.frame = frame
+        self.SetIcon(wx.Icon('icon.png', wx.BITMAP_TYPE_PNG), 'LLM Chat')
+        
+    def CreatePopupMenu(self):
+        menu = wx.Menu()
+        show_item = menu.Append(-1, '显示')
+        exit_item = menu.Append(-1, '退出')
+        
+        self.Bind(wx.EVT_MENU, self.OnShow, show_item)
+        self.Bind(wx.EVT_MENU, self.OnExit, exit_item)
+        return menu
+    
+    def OnShow(self, event):
+        self.frame.show_window()
+        
+    def OnExit(self, event):
+        self.frame.force_exit(event)
@@ -1,7 +1,7 @@
 import wx
-import json
-from wx.adv import TaskBarIcon
+import time
 import wx.lib.scrolledpanel as scrolled
+from .metrics import MetricsRegistry
 
 
 class AgentConfigDialog(wx.Dialog):
@@ -200,9 +200,7 @@ class AgentConfigDialog(wx.Dialog):
         self.delete_button.Disable()
         
     def OnSave(self, event):
-        """保存所有更改"""
-        with open('config.json', 'w', encoding='utf-8') as f:
-            json.dump(self.config, f, indent=4)
+        """确认所有更改, 由调用方提交到配置管理器"""
         self.EndModal(wx.ID_OK)
 
 
@@ -250,32 +248,154 @@ class ConfigDialog(wx.Dialog):
         self.config['openai']['api_key'] = self.api_key.GetValue()
         self.config['openai']['base_url'] = self.base_url.GetValue()
         self.config['hotkeys']['show_window'] = self.hotkey.GetValue()
-        
-        with open('config.json', 'w', encoding='utf-8') as f:
-            json.dump(self.config, f, indent=4)
-        
         self.EndModal(wx.ID_OK)
     
     def OnCancel(self, event):
         self.EndModal(wx.ID_CANCEL)
 
-class ChatTrayIcon(TaskBarIcon):
-    def __init__(self, frame):
-        super().__init__()
-        self.frame = frame
-        self.SetIcon(wx.Icon('icon.png', wx.BITMAP_TYPE_PNG), 'LLM Chat')
-        
-    def CreatePopupMenu(self):
-        menu = wx.Menu()
-        show_item = menu.Append(-1, '显示')
-        exit_item = menu.Append(-1, '退出')
-        
-        self.Bind(wx.EVT_MENU, self.OnShow, show_item)
-        self.Bind(wx.EVT_MENU, self.OnExit, exit_item)
-        return menu
-    
-    def OnShow(self, event):
-        self.frame.show_window()
-        
-    def OnExit(self, event):
-        self.frame.force_exit(event)
+class StatisticsDialog(wx.Dialog):
+    """按agent/model显示请求延迟统计"""
+
+    COLUMNS = [
+        ("Agent", 80), ("模型", 140), ("请求", 50), ("错误", 50), ("缓存命中", 70),
+        ("首字节p50", 80), ("首字p50", 80), ("首字p95", 80), ("字间隔p95", 80),
+        ("总耗时p50", 80), ("总耗时p95", 80), ("界面延迟p95", 90), ("token/秒", 70)
+    ]
+
+    def __init__(self, parent):
+        super().__init__(parent, title="统计", size=(800, 400),
+                         style=wx.DEFAULT_DIALOG_STYLE | wx.RESIZE_BORDER)
+        self.InitUI()
+        self.load_statistics()
+
+    def InitUI(self):
+        panel = wx.Panel(self)
+        vbox = wx.BoxSizer(wx.VERTICAL)
+
+        self.stats_list = wx.ListCtrl(panel, style=wx.LC_REPORT)
+        for index, (title, width) in enumerate(self.COLUMNS):
+            self.stats_list.InsertColumn(index, title, width=width)
+
+        hint = wx.StaticText(panel, -1, "时间单位为毫秒, 完整数据见logs目录下的metrics.json和metrics.prom")
+
+        button_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        refresh_btn = wx.Button(panel, -1, "刷新(&R)")
+        close_btn = wx.Button(panel, wx.ID_CANCEL, "关闭")
+        button_sizer.Add(refresh_btn)
+        button_sizer.Add(close_btn, 0, wx.LEFT, 5)
+
+        vbox.Add(self.stats_list, 1, wx.EXPAND | wx.ALL, 5)
+        vbox.Add(hint, 0, wx.ALL, 5)
+        vbox.Add(button_sizer, 0, wx.ALIGN_RIGHT | wx.ALL, 5)
+        panel.SetSizer(vbox)
+
+        refresh_btn.Bind(wx.EVT_BUTTON, lambda event: self.load_statistics())
+
+    def load_statistics(self):
+        """从指标注册表加载汇总数据"""
+        self.stats_list.DeleteAllItems()
+
+        def ms(hist, key):
+            return f"{hist[key] * 1000:.0f}" if hist['count'] else "-"
+
+        for series in MetricsRegistry.get_registry().snapshot():
+            h = series['histograms']
+            rate = h['tokens_per_second']
+            row = [
+                series['agent'], series['model'], str(series['requests']), str(series['errors']),
+                str(series['cache_hits']),
+                ms(h['ttfb'], 'p50'), ms(h['ttft'], 'p50'), ms(h['ttft'], 'p95'),
+                ms(h['inter_token_gap'], 'p95'), ms(h['total'], 'p50'), ms(h['total'], 'p95'),
+                ms(h['ui_apply'], 'p95'), f"{rate['p50']:.1f}" if rate['count'] else "-"
+            ]
+            index = self.stats_list.InsertItem(self.stats_list.GetItemCount(), row[0])
+            for column, value in enumerate(row[1:], start=1):
+                self.stats_list.SetItem(index, column, value)
+
+
+class SearchDialog(wx.Dialog):
+    """全文搜索所有保存的对话, 选中结果后返回 (对话id, agent, 消息id, 查询词)"""
+
+    def __init__(self, parent, store):
+        super().__init__(parent, title="搜索对话", size=(600, 450),
+                         style=wx.DEFAULT_DIALOG_STYLE | wx.RESIZE_BORDER)
+        self.store = store
+        self.results = []
+        self.selection = None
+        self.search_call = None
+        self.InitUI()
+
+    def InitUI(self):
+        panel = wx.Panel(self)
+        vbox = wx.BoxSizer(wx.VERTICAL)
+
+        label = wx.StaticText(panel, -1, "搜索内容(Enter或双击跳转, 上下键选择结果):")
+        self.query_text = wx.TextCtrl(panel, style=wx.TE_PROCESS_ENTER)
+        self.result_list = wx.ListCtrl(panel, style=wx.LC_REPORT | wx.LC_SINGLE_SEL)
+        self.result_list.InsertColumn(0, "Agent", width=80)
+        self.result_list.InsertColumn(1, "角色", width=60)
+        self.result_list.InsertColumn(2, "时间", width=120)
+        self.result_list.InsertColumn(3, "内容", width=320)
+        self.status_text = wx.StaticText(panel, -1, "")
+
+        vbox.Add(label, 0, wx.ALL, 5)
+        vbox.Add(self.query_text, 0, wx.EXPAND | wx.LEFT | wx.RIGHT, 5)
+        vbox.Add(self.result_list, 1, wx.EXPAND | wx.ALL, 5)
+        vbox.Add(self.status_text, 0, wx.LEFT | wx.RIGHT | wx.BOTTOM, 5)
+        panel.SetSizer(vbox)
+
+        self.query_text.Bind(wx.EVT_TEXT, self.OnQueryChanged)
+        self.query_text.Bind(wx.EVT_TEXT_ENTER, self.OnActivate)
+        self.query_text.Bind(wx.EVT_KEY_DOWN, self.OnQueryKeyDown)
+        self.result_list.Bind(wx.EVT_LIST_ITEM_ACTIVATED, self.OnActivate)
+        self.query_text.SetFocus()
+
+    def OnQueryChanged(self, event):
+        """输入停顿后再搜索, 连续输入时不重复查询"""
+        if self.search_call is not None:
+            self.search_call.Stop()
+        self.search_call = wx.CallLater(150, self.run_search)
+
+    def OnQueryKeyDown(self, event):
+        """在输入框中用上下键移动结果选择"""
+        key = event.GetKeyCode()
+        count = self.result_list.GetItemCount()
+        if key in (wx.WXK_DOWN, wx.WXK_UP) and count:
+            current = self.result_list.GetFirstSelected()
+            step = 1 if key == wx.WXK_DOWN else -1
+            index = min(max(current + step, 0), count - 1)
+            self.result_list.Select(index)
+            self.result_list.EnsureVisible(index)
+        else:
+            event.Skip()
+
+    def run_search(self):
+        query = self.query_text.GetValue().strip()
+        self.result_list.DeleteAllItems()
+        self.results = self.store.search(query) if query else []
+        for message_id, conversation_id, agent, role, content, created in self.results:
+            index = self.result_list.InsertItem(self.result_list.GetItemCount(), agent)
+            self.result_list.SetItem(index, 1, "用户" if role == "user" else "AI")
+            self.result_list.SetItem(index, 2, time.strftime("%Y-%m-%d %H:%M", time.localtime(created)))
+            self.result_list.SetItem(index, 3, self.snippet(content, query))
+        if self.results:
+            self.result_list.Select(0)
+        self.status_text.SetLabel(f"找到{len(self.results)}条结果" if query else "")
+
+    @staticmethod
+    def snippet(content, query, width=60):
+        """截取第一个匹配词附近的内容"""
+        content = content.replace("\n", " ")
+        lowered = content.lower()
+        positions = [lowered.find(word.lower()) for word in query.split()]
+        positions = [p for p in positions if p >= 0]
+        start = max(min(positions) - width // 4, 0) if positions else 0
+        return ("..." if start else "") + content[start:start + width]
+
+    def OnActivate(self, event):
+        index = self.result_list.GetFirstSelected()
+        if index < 0:
+            return
+        message_id, conversation_id, agent, _, _, _ = self.results[index]
+        self.selection = (conversation_id, agent, message_id, self.query_text.GetValue().strip())
+        self.EndModal(wx.ID_OK)
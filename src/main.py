@@ -1,25 +1,77 @@
-import wx
-from lib.chat_frame import ChatFrame
+import time
+START = time.perf_counter()
+
+import argparse
+import sys
+from lib.config_manager import ConfigManager
 from lib.logger_manager import LoggerManager
+from lib.single_instance import InstanceServer, send_command, DEFAULT_PORT
+from lib.startup_timer import StartupTimer
+
+def parse_command(argv=None):
+    """把命令行参数转换为单实例命令"""
+    parser = argparse.ArgumentParser(description="Quick Chat Launcher, 已在运行时把命令转发给运行中的实例")
+    parser.add_argument("--ask", metavar="PROMPT", help="在新标签页中发送提问")
+    parser.add_argument("--agent", help="提问使用的agent(默认default)")
+    parser.add_argument("--open", metavar="CONVERSATION_ID", help="打开保存的对话")
+    args = parser.parse_args(argv)
+    if args.ask:
+        return {'command': 'ask', 'prompt': args.ask, 'agent': args.agent}
+    if args.open:
+        return {'command': 'open', 'conversation_id': args.open}
+    return {'command': 'show'}
 
 def main():
+    command = parse_command()
+
     # 初始化日志系统
     logger = LoggerManager.get_logger()
+    config_manager = ConfigManager()
+    port = config_manager.get_config().get('ipc', {}).get('port', DEFAULT_PORT)
+
+    # 已有实例在运行时转发命令后立即退出, 不导入wx
+    server = InstanceServer(port=port)
+    while not server.start():
+        reply = send_command(command, port=port)
+        if reply is not None:
+            if not reply.get('ok'):
+                print(f"错误: {reply.get('error')}", file=sys.stderr)
+                return 1
+            logger.info(f"已转发到运行中的实例: {command['command']}")
+            return 0
+        # 端口被占用但没有回应: 可能是正在退出的实例, 稍后重试
+        time.sleep(0.2)
+        if time.perf_counter() - START > 5:
+            logger.error(f"端口{port}被占用且无法连接运行中的实例")
+            return 1
+
     logger.info("=== 程序启动 ===")
-    
+    startup_timer = StartupTimer(START)
+    startup_timer.mark("单实例检查")
+
+    import wx
+    startup_timer.mark("导入wx")
+
     try:
         app = wx.App()
         logger.info("wxPython应用程序初始化成功")
-        
-        frame = ChatFrame()
+        startup_timer.mark("创建wx.App")
+
+        from lib.chat_frame import ChatFrame
+        startup_timer.mark("导入主窗口")
+
+        frame = ChatFrame(config_manager, startup_timer=startup_timer, instance_server=server,
+                          initial_command=command if command['command'] != 'show' else None)
         frame.Show()
         logger.info("主窗口创建并显示成功")
-        
+
         app.MainLoop()
     except Exception as e:
         logger.error(f"程序运行时发生错误: {str(e)}")
     finally:
+        server.close()
         logger.info("=== 程序退出 ===")
+    return 0
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 程序以 src 为根目录运行(python src/chat.py), 测试同样从这里导入 lib
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
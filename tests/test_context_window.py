@@ -0,0 +1,64 @@
+import pytest
+
+from lib.context_window import ContextWindow
+
+
+def make_window(turns):
+    window = ContextWindow("系统提示")
+    for i in range(turns):
+        window.append("user", f"问题{i} " + "问" * 40)
+        window.append("assistant", f"回答{i} " + "答" * 60)
+    window.append("user", "最新的问题")
+    return window
+
+
+def roles(messages):
+    return [message["role"] for message in messages]
+
+
+def test_without_budget_sends_everything():
+    window = make_window(3)
+    assert len(window.build_messages()) == len(window)
+
+
+def test_drop_oldest_drops_whole_turns():
+    window = make_window(4)
+    messages = window.build_messages(max_tokens=200)
+    assert roles(messages) == ["system", "user", "assistant", "user"]
+    assert messages[1]["content"].startswith("问题3")
+    assert messages[-1]["content"] == "最新的问题"
+
+
+def test_drop_oldest_never_starts_with_a_reply():
+    window = make_window(5)
+    for budget in range(60, 800, 20):
+        messages = window.build_messages(max_tokens=budget)
+        assert messages[1]["role"] != "assistant"
+
+
+def test_keep_last_drops_whole_turns():
+    window = make_window(4)
+    messages = window.build_messages(policy='keep_last', keep_last=3)
+    assert roles(messages) == ["system", "user", "assistant", "user"]
+
+
+def test_pinned_and_system_messages_are_kept():
+    window = make_window(4)
+    window.pin(1)
+    messages = window.build_messages(max_tokens=10)
+    assert messages[0]["content"] == "系统提示"
+    assert messages[1]["content"].startswith("问题0")
+    assert messages[-1]["content"] == "最新的问题"
+
+
+def test_summary_replaces_covered_messages():
+    window = make_window(3)
+    window.set_summary("之前聊了三轮", 5)
+    messages = window.build_messages()
+    assert messages[1] == {"role": "system", "content": "之前对话的摘要:\n之前聊了三轮"}
+    assert messages[2]["content"].startswith("问题2")
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        make_window(1).build_messages(policy='random')
@@ -0,0 +1,59 @@
+import sqlite3
+
+from lib.conversation_store import SCHEMA, segment_text, build_match_query
+
+DOCUMENTS = [
+    "今天天气很好, 我们去公园散步",
+    "Python的asyncio事件循环",
+    "数据库使用WAL模式",
+    "猫",
+]
+
+
+def make_index():
+    conn = sqlite3.connect(':memory:')
+    conn.executescript(SCHEMA)
+    conn.executemany(
+        "INSERT INTO messages_fts (rowid, content) VALUES (?, ?)",
+        [(i, segment_text(text)) for i, text in enumerate(DOCUMENTS)])
+    return conn
+
+
+def search(conn, query):
+    rows = conn.execute(
+        "SELECT rowid FROM messages_fts WHERE messages_fts MATCH ? ORDER BY rowid",
+        (build_match_query(query),))
+    return [DOCUMENTS[rowid] for rowid, in rows]
+
+
+def test_segment_text_splits_cjk_into_bigrams():
+    assert segment_text("天气很好").split() == ["天气", "气很", "很好", "好"]
+    assert segment_text("用Python写").split() == ["用", "Python", "写"]
+    assert segment_text(None) == ""
+
+
+def test_build_match_query():
+    assert build_match_query("天气很好") == '"天气 气很 很好"'
+    assert build_match_query("猫") == '"猫"*'
+    assert build_match_query("async 事件") == '"async"* "事件"'
+
+
+def test_chinese_substring_matches():
+    conn = make_index()
+    assert search(conn, "天气很好") == [DOCUMENTS[0]]
+    assert search(conn, "气很") == [DOCUMENTS[0]]
+    assert search(conn, "很天") == []
+
+
+def test_single_character_matches_any_position():
+    conn = make_index()
+    assert search(conn, "园") == [DOCUMENTS[0]]
+    assert search(conn, "步") == [DOCUMENTS[0]]
+    assert search(conn, "猫") == [DOCUMENTS[3]]
+
+
+def test_english_words_match_by_prefix_and_combine_with_chinese():
+    conn = make_index()
+    assert search(conn, "async") == [DOCUMENTS[1]]
+    assert search(conn, "wal 数据") == [DOCUMENTS[2]]
+    assert search(conn, "python 数据") == []
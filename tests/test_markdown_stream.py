@@ -0,0 +1,59 @@
+import random
+
+from lib.markdown_stream import StreamingMarkdown
+
+SOURCE = """# 标题 **粗体**
+普通段落, 含 `行内代码`、*斜体* 和 [链接](https://example.com)。
+> 引用的一行
+- 列表项
+  - 第二级 **粗**
+1. 编号项
+---
+```python
+def f():
+    return "**不是粗体**"
+```
+最后一行没有换行 😀"""
+
+
+def render(chunks):
+    """按增量喂给解析器, 像 MessageItem 一样拼出完整文本和样式区间"""
+    markdown = StreamingMarkdown()
+    text = ""
+    spans = []
+    for chunk in chunks:
+        (done, done_spans), (tail, tail_spans) = markdown.feed(chunk)
+        spans.extend((start + len(text), end + len(text), style) for start, end, style in done_spans)
+        text += done
+    spans.extend((start + len(text), end + len(text), style) for start, end, style in tail_spans)
+    return text + tail, spans, markdown.line_styles, markdown.tail_style
+
+
+def random_chunks(source, rng):
+    chunks = []
+    position = 0
+    while position < len(source):
+        size = rng.randint(1, 12)
+        chunks.append(source[position:position + size])
+        position += size
+    return chunks
+
+
+def test_random_chunking_matches_single_pass():
+    expected = render([SOURCE])
+    rng = random.Random(20)
+    for _ in range(200):
+        assert render(random_chunks(SOURCE, rng)) == expected
+
+
+def test_headings_and_quotes_keep_spoken_prefix():
+    text, spans, line_styles, _ = render(["## 小节\n> 引用\n"])
+    assert text == "[标题2] 小节\n[引用] 引用\n"
+    assert (0, len("[标题2] 小节"), 'h2') in spans
+    assert line_styles == ['h2', 'quote']
+
+
+def test_code_block_content_is_not_parsed_as_markdown():
+    text, spans, line_styles, _ = render(["```\n# 不是标题\n```\n"])
+    assert text == "[代码]\n# 不是标题\n[代码结束]\n"
+    assert line_styles == [None, 'code_block', None]
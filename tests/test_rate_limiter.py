@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+from lib.rate_limiter import TokenBucket, EndpointLimiter, RateLimiter
+
+
+def test_token_bucket_refills_at_per_minute_rate():
+    bucket = TokenBucket(60)
+    start = bucket.last
+    assert bucket.wait_time(60, start) == 0.0
+    bucket.consume(60)
+    assert bucket.wait_time(1, start) == 1.0
+    assert bucket.wait_time(1, start + 1.0) == 0.0
+
+
+def test_token_bucket_caps_oversized_requests_at_capacity():
+    bucket = TokenBucket(60)
+    start = bucket.last
+    bucket.consume(60)
+    # 超过容量的请求按整桶计算, 等一分钟即可放行
+    assert bucket.wait_time(1000, start) == 60.0
+
+
+def test_endpoint_limiter_serves_waiters_in_order():
+    async def scenario():
+        limiter = EndpointLimiter(tpm=6000)  # 每秒补充100个token
+        await limiter.acquire(6000)
+        order = []
+
+        async def request(name, tokens):
+            await limiter.acquire(tokens)
+            order.append(name)
+
+        big = asyncio.ensure_future(request('big', 30))
+        await asyncio.sleep(0)
+        small = asyncio.ensure_future(request('small', 1))
+        await asyncio.gather(big, small)
+        return order
+
+    # 后到的小请求不能插队到先到的大请求前面
+    assert asyncio.run(scenario()) == ['big', 'small']
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        limiter = EndpointLimiter(rpm=60)
+        await limiter.acquire(0)
+        waiter = asyncio.ensure_future(limiter.acquire(0))
+        await asyncio.sleep(0)
+        assert limiter.depth == 1
+        waiter.cancel()
+        await asyncio.sleep(0)
+        return limiter.depth
+
+    assert asyncio.run(scenario()) == 0
+
+
+def test_rate_limiter_matches_rules_and_honours_retry_after():
+    async def scenario():
+        limiter = RateLimiter([{'base_url': 'http://a/', 'model': '*', 'rpm': 600}])
+        assert limiter._limiter('http://b/', 'm') is None
+        assert limiter._limiter('http://a/', 'm') is not None
+        # 没有规则的endpoint收到429后也要等待
+        limiter.on_rate_limited('http://b/', 'm', 0.2)
+        start = time.monotonic()
+        await limiter.acquire('http://b/', 'm', 10)
+        return time.monotonic() - start
+
+    assert asyncio.run(scenario()) >= 0.15